@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from backend.startup import HEAVY_MODULES, parse_importtime, run_startup
+
+
+class Command(BaseCommand):
+    help = 'Import a fresh Django (settings, app registry, URLconf) under -X importtime and print the slowest modules as a tree.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-ms', type=float, default=1.0, help='Hide modules whose cumulative import time is below this.')
+        parser.add_argument('--depth', type=int, default=4, help='Levels of nested imports to show.')
+        parser.add_argument('--top', type=int, default=25, help='Top-level imports to show.')
+
+    def handle(self, *args, **options):
+        phases, report = run_startup(importtime=True)
+        roots = parse_importtime(report)
+
+        self.stdout.write(
+            f"settings {phases['settings'] * 1000:.0f} ms, apps {phases['apps'] * 1000:.0f} ms, "
+            f"urls {phases['urls'] * 1000:.0f} ms, total {phases['total'] * 1000:.0f} ms "
+            f"({len(phases['modules'])} modules, timings inflated by -X importtime)"
+        )
+        self.stdout.write(f"{'cumulative':>10} {'self':>8}  module")
+        roots = sorted(roots, key=lambda node: node['cumulative_us'], reverse=True)
+        for node in roots[:options['top']]:
+            self.write_node(node, 0, options)
+
+        loaded = [name for name in HEAVY_MODULES if name in phases['modules']]
+        if loaded:
+            self.stdout.write(self.style.WARNING(f"Heavy modules imported at startup: {', '.join(loaded)}"))
+
+    def write_node(self, node, level, options):
+        if node['cumulative_us'] < options['min_ms'] * 1000:
+            return
+        self.stdout.write(
+            f"{node['cumulative_us'] / 1000:8.1f}ms {node['self_us'] / 1000:6.1f}ms  {'  ' * level}{node['name']}"
+        )
+        if level + 1 < options['depth']:
+            for child in sorted(node['children'], key=lambda child: child['cumulative_us'], reverse=True):
+                self.write_node(child, level + 1, options)
@@ -0,0 +1,236 @@
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.negotiation import BaseContentNegotiation
+
+# HLS segments, Python maps .ts to Qt translation files
+mimetypes.add_type('video/mp2t', '.ts')
+
+RANGE_RE = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Media responses are not rendered, so any Accept header is fine."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of an open file from its current position.
+
+    ``fileno()`` is kept so WSGI servers with a ``wsgi.file_wrapper``
+    (gunicorn, uWSGI) can still hand the range to ``os.sendfile``; they
+    start at the current offset and stop at the Content-Length we set.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Return the inclusive ``(start, end)`` of a single byte range, or None to serve the whole file."""
+    match = RANGE_RE.match(header or '')
+    if not match:
+        # Multiple ranges and other units are optional, answer with the full body
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Not a valid range at all, so the header is ignored (RFC 9110, 14.2)
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, min(int(last) if last else size - 1, size - 1)
+
+
+def _etag(stat):
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag  # weak validators never match
+    # A date only matches the exact Last-Modified we sent
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def ranged_file_response(request, path, content_type=None):
+    """Serve a file from disk honouring Range, If-Range and If-None-Match."""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = _etag(stat)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if request.META.get('HTTP_RANGE') and _if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+# --- Signed media URLs ---
+
+def _media_signature(name, expires, salt='backend.media'):
+    return salted_hmac(salt, f'{name}:{expires}', algorithm='sha256').hexdigest()[:32]
+
+
+def _expiry(ttl):
+    # Expiry is rounded up to a TTL boundary so repeated requests for a page
+    # produce the same URL and the browser can keep using its cached bytes.
+    return (int(time.time()) // ttl + 2) * ttl
+
+
+def signed_media_url(name, ttl=None):
+    """Return a relative URL for a stored file that expires in ``ttl`` to ``2 * ttl`` seconds."""
+    expires = _expiry(ttl or settings.MEDIA_SIGNED_URL_TTL)
+    path = reverse('signed-media', kwargs={'path': name})
+    return f'{path}?expires={expires}&signature={_media_signature(name, expires)}'
+
+
+def signed_prefix_url(prefix, name, ttl=None):
+    """URL for ``<prefix>/<name>`` whose signature is valid for every file under ``prefix``.
+
+    The token is a path segment rather than a query string, so URLs the
+    client resolves relative to this one (HLS playlists and segments)
+    carry it along.
+    """
+    prefix = prefix.strip('/')
+    expires = _expiry(ttl or settings.MEDIA_SIGNED_URL_TTL)
+    depth = prefix.count('/') + 1
+    signature = _media_signature(prefix, expires, salt='backend.media.prefix')
+    return reverse('signed-prefix-media', kwargs={'token': f'{expires}.{depth}.{signature}', 'path': f'{prefix}/{name}'})
+
+
+def media_url(fieldfile):
+    """URL to hand out for a FileField value, signed when MEDIA_SIGNED_URLS is on."""
+    if settings.MEDIA_SIGNED_URLS:
+        return signed_media_url(fieldfile.name)
+    return fieldfile.url
+
+
+def signed_media_view(request, path):
+    """Check a signed media URL and let the front proxy send the file.
+
+    With MEDIA_OFFLOAD set to ``nginx`` the response only carries an
+    X-Accel-Redirect to MEDIA_ACCEL_PREFIX, which nginx must map to
+    MEDIA_ROOT in an ``internal`` location; ``sendfile`` uses the
+    X-Sendfile header understood by Apache and lighttpd. Without
+    offloading the file is streamed by Django.
+    """
+    expires = request.GET.get('expires', '')
+    signature = request.GET.get('signature', '')
+    if not expires.isdigit() or int(expires) < time.time():
+        return HttpResponseForbidden('Link expired.')
+    if not constant_time_compare(signature, _media_signature(path, int(expires))):
+        return HttpResponseForbidden('Invalid signature.')
+    return _media_response(request, path, int(expires))
+
+
+def signed_prefix_media_view(request, token, path):
+    """Serve a file under the directory signed into ``token``, see ``signed_prefix_url``."""
+    try:
+        expires, depth, signature = token.split('.')
+        expires, depth = int(expires), int(depth)
+    except ValueError:
+        return HttpResponseForbidden('Invalid signature.')
+    parts = path.split('/')
+    if depth < 1 or len(parts) <= depth or any(part in ('', '.', '..') for part in parts):
+        # Dot segments could step out of the signed directory
+        raise Http404
+    if expires < time.time():
+        return HttpResponseForbidden('Link expired.')
+    prefix = '/'.join(parts[:depth])
+    if not constant_time_compare(signature, _media_signature(prefix, expires, salt='backend.media.prefix')):
+        return HttpResponseForbidden('Invalid signature.')
+    return _media_response(request, path, expires)
+
+
+def _media_response(request, path, expires):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_OFFLOAD == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    elif settings.MEDIA_OFFLOAD == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        if not os.path.isfile(full_path):
+            raise Http404
+        response = ranged_file_response(request, full_path, content_type)
+    response['Cache-Control'] = f'private, max-age={max(expires - int(time.time()), 0)}'
+    return response
@@ -0,0 +1,101 @@
+import json
+import operator
+from functools import reduce
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Opaque cursor pagination over the primary key.
+
+    Each page is fetched with ``WHERE id > <cursor> LIMIT n``, so later
+    pages cost the same as the first instead of an OFFSET scan.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class KeysetCursorPagination(IdCursorPagination):
+    """Cursor pagination over several ordering fields, the last one unique.
+
+    DRF's CursorPagination only positions on the first ordering field and
+    steps over rows sharing its value with an OFFSET (capped at
+    ``offset_cutoff``). Here the cursor holds the values of every ordering
+    field and the next page starts at the row comparison
+    ``(a, b) > (x, y)``, so ties cost nothing. Ordering fields must not be
+    nullable.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                values = json.loads(position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self._after(ordering, values))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _after(ordering, values):
+        """Rows strictly after ``values`` in ``ordering``."""
+        alternatives, equal = [], Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            alternatives.append(equal & Q(**{f"{name}__{'lt' if field.startswith('-') else 'gt'}": value}))
+            equal &= Q(**{name: value})
+        return reduce(operator.or_, alternatives)
+
+    def _position(self, instance):
+        return json.dumps([str(getattr(instance, field.lstrip('-'))) for field in self.ordering])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self._position(self.page[0])))
+
+
+class CourseOrderCursorPagination(KeysetCursorPagination):
+    """Cursor pagination for videos listed in their course order."""
+    ordering = ('order_in_course', 'id')
+
+
+class ChatHistoryCursorPagination(KeysetCursorPagination):
+    """Newest messages first, older pages follow the ``next`` cursor."""
+    ordering = ('-sent_at', '-id')
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework_simplejwt',
+    # Project-wide management commands, e.g. profile_startup
+    'backend',
     'users',
     'content',
     'communication',
@@ -102,7 +104,41 @@ DATABASES = {
     }
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# In-memory Firestore and unsigned custom tokens instead of Firebase, see users/firebase/
+FIREBASE_USE_FAKE = config('FIREBASE_USE_FAKE', default=False, cast=bool)
+FIREBASE_TOKEN_CACHE_ALIAS = 'default'
+FIREBASE_TOKEN_REFRESH_MARGIN = 300  # seconds before expiry a cached custom token is replaced
+
+# Chat messages are committed to Firestore in batches by a thread of each process
+FIRESTORE_WRITER_BATCH_SIZE = 500  # Firestore's limit per batch
+FIRESTORE_WRITER_FLUSH_INTERVAL = 0.005
+FIRESTORE_WRITER_MAX_RETRIES = 5
+FIRESTORE_WRITER_MAX_PENDING = 10000
+
+# Shared cache for short-lived state (OTPs, throttle buckets). Use Redis when
+# several workers or servers run: with the local-memory default every process
+# keeps its own OTPs and buckets, so throttle rates apply per worker.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# One-time passwords, see users/otp.py
+OTP_CACHE_ALIAS = 'default'
+OTP_TTL = 600  # seconds
+OTP_MAX_ATTEMPTS = 5
+
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -110,6 +146,11 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = f"GSMP <{config('EMAIL_HOST_USER')}>"
 
+# Outbox drained by manage.py send_outbox
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF = 60  # seconds, doubled after each failed attempt
+EMAIL_OUTBOX_RETENTION = 30 * 24 * 3600  # seconds sent emails are kept for
+
 
 
 AUTH_USER_MODEL = 'users.User'
@@ -158,6 +199,45 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hand out expiring HMAC-signed media URLs instead of raw /media/ links
+MEDIA_SIGNED_URLS = config('MEDIA_SIGNED_URLS', default=False, cast=bool)
+MEDIA_SIGNED_URL_TTL = config('MEDIA_SIGNED_URL_TTL', default=3600, cast=int)  # seconds
+# HLS links are always signed; segments are fetched for as long as playback lasts
+MEDIA_HLS_URL_TTL = config('MEDIA_HLS_URL_TTL', default=4 * 3600, cast=int)
+# How signed media is delivered: 'nginx' (X-Accel-Redirect), 'sendfile' (X-Sendfile)
+# or '' to stream from Django
+MEDIA_OFFLOAD = config('MEDIA_OFFLOAD', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+
+# Background video processing (manage.py run_processing_jobs)
+PROCESSING_WORKERS = config('PROCESSING_WORKERS', default=2, cast=int)
+PROCESSING_JOB_MAX_ATTEMPTS = 5
+PROCESSING_JOB_BACKOFF = 30  # seconds, doubled after each failed attempt
+PROCESSING_JOB_TIMEOUT = 60 * 60  # running jobs older than this are requeued on worker start
+
+# HLS renditions produced for each uploaded video: (height, video kbit/s)
+VIDEO_HLS_ENABLED = config('VIDEO_HLS_ENABLED', default=True, cast=bool)
+VIDEO_HLS_RENDITIONS = [(240, 400), (360, 800), (480, 1400), (720, 2800), (1080, 5000)]
+VIDEO_HLS_AUDIO_BITRATE = 96  # kbit/s
+VIDEO_HLS_SEGMENT_SECONDS = 6
+
+# Widths (px) that course and video thumbnails are resized to
+THUMBNAIL_WIDTHS = (160, 320, 640)
+
+# Resumable uploads, see content/uploads.py
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 3600  # seconds an unfinished upload is kept
+UPLOAD_MAX_SIZES = {
+    'video': config('VIDEO_UPLOAD_MAX_SIZE', default=2 * 1024 ** 3, cast=int),
+    'mentor_intro_video': 150 * 1024 * 1024,
+}
+
+# Seconds an unreferenced video blob is kept before it is deleted, see content/blobs.py
+MEDIA_BLOB_GRACE = 3600
+
+# Seconds a cold django.setup() plus URLconf import may take, see backend/tests.py
+STARTUP_BUDGET_SECONDS = config('STARTUP_BUDGET_SECONDS', default=3.0, cast=float)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -165,8 +245,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'users.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'backend.pagination.IdCursorPagination',
+    'PAGE_SIZE': config('API_PAGE_SIZE', default=50, cast=int),
+    # Token buckets for the public endpoints, see backend/throttling.py. They live in
+    # the default cache, so they are shared between workers only with REDIS_URL
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '20/min',
+        'login_email': '10/min',
+        'otp_ip': '10/hour',
+        'otp_email': '5/hour',
+        'register_ip': '10/hour',
+        'upload_ip': '20/hour',
+    },
+    # Number of reverse proxies in front of Django, so the client IP is read from X-Forwarded-For
+    'NUM_PROXIES': config('NUM_PROXIES', default=None, cast=lambda v: int(v) if v not in (None, '') else None),
 }
 
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '196.13.252.30','gmspignite.aims.edu.gh']
@@ -184,3 +278,12 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': False,
 }
+
+# Authenticated users kept in memory per process, see users/authentication.py
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=10000, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=300, cast=int)  # seconds, 0 disables
+
+# Revoked token ids mirrored into a Bloom filter per process, see users/revocation.py
+JWT_REVOCATION_CAPACITY = 100000
+JWT_REVOCATION_ERROR_RATE = 0.001
+JWT_REVOCATION_REFRESH = 5  # seconds between pulls of newly revoked tokens
@@ -0,0 +1,76 @@
+"""Measure what a cold Django startup imports and how long it takes.
+
+Startup runs in a fresh interpreter (settings, app registry, URLconf),
+optionally under ``python -X importtime``, whose report is parsed into
+a tree of modules with their own and cumulative import time.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+
+# Kept out of startup, the code that needs them imports them on first use
+HEAVY_MODULES = (
+    'moviepy', 'numpy', 'imageio', 'imageio_ffmpeg', 'PIL',
+    'firebase_admin', 'google.cloud.firestore', 'grpc',
+)
+
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+settings_loaded = time.perf_counter()
+django.setup()
+apps_ready = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls_loaded = time.perf_counter()
+print(json.dumps({
+    'settings': settings_loaded - started,
+    'apps': apps_ready - settings_loaded,
+    'urls': urls_loaded - apps_ready,
+    'total': urls_loaded - started,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+def run_startup(importtime=False):
+    """Start Django in a new process; return its phase timings and the raw importtime report."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    result = subprocess.run(
+        command + ['-c', STARTUP_SCRIPT], cwd=settings.BASE_DIR, env=env,
+        capture_output=True, text=True, check=True, timeout=120,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(report):
+    """Turn ``-X importtime`` output into a list of root nodes.
+
+    Each node is ``{'name', 'self_us', 'cumulative_us', 'children'}``.
+    Python prints a module after everything it imported, one indentation
+    step deeper, so children are collected until their parent shows up.
+    """
+    pending = defaultdict(list)
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        pending[depth].append({
+            'name': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'children': pending.pop(depth + 1, []),
+        })
+    return pending[0]
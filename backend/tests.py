@@ -0,0 +1,186 @@
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from backend.media import ranged_file_response
+from backend.startup import HEAVY_MODULES, run_startup
+from backend.throttling import TokenBucketThrottle, take_token
+
+
+class StartupTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.phases, _ = run_startup()
+
+    def test_startup_within_budget(self):
+        self.assertLess(
+            self.phases['total'], settings.STARTUP_BUDGET_SECONDS,
+            "Cold startup is over budget, see `manage.py profile_startup`.",
+        )
+
+    def test_heavy_modules_deferred(self):
+        loaded = [name for name in HEAVY_MODULES if name in self.phases['modules']]
+        self.assertEqual(loaded, [], "Import these where they are used, not at module level.")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class FakeRedisScript:
+    """The GCRA script, run in Python against a dict."""
+
+    def __init__(self, store, clock):
+        self.store = store
+        self.clock = clock
+        self.calls = []
+
+    def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        now, (interval, burst) = self.clock.now, args
+        tat = max(self.store.get(keys[0], now), now)
+        if tat - now > burst:
+            return [0, str(tat - burst - now)]
+        self.store[keys[0]] = tat + interval
+        return [1, '0']
+
+
+class TakeTokenTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = FakeClock()
+        patcher = mock.patch('backend.throttling.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def drain(self, backend, key, capacity=5, period=60):
+        return [take_token(backend, key, capacity, period) for _ in range(capacity + 1)]
+
+    def assertBurstThenRefill(self, backend):
+        results = self.drain(backend, 'bucket')
+        self.assertEqual([allowed for allowed, _ in results], [True] * 5 + [False])
+        self.assertAlmostEqual(results[-1][1], 12)  # one token per 60 / 5 seconds
+
+        self.clock.now += 11
+        self.assertFalse(take_token(backend, 'bucket', 5, 60)[0])
+        self.clock.now += 1
+        self.assertEqual(take_token(backend, 'bucket', 5, 60), (True, 0.0))
+        self.assertFalse(take_token(backend, 'bucket', 5, 60)[0])
+
+        self.clock.now += 60  # a full bucket again, not more
+        self.assertEqual([allowed for allowed, _ in self.drain(backend, 'bucket')], [True] * 5 + [False])
+
+    def test_local_buckets(self):
+        self.assertBurstThenRefill(cache)
+        self.assertTrue(take_token(cache, 'other', 5, 60)[0])
+
+    def test_redis_buckets(self):
+        redis_cache = RedisCache('redis://localhost:6379/0', {'KEY_PREFIX': 'gmsp'})
+        client = mock.Mock()
+        script = FakeRedisScript({}, self.clock)
+        client.register_script.return_value = script
+        # Stands in for Django's RedisCacheClient, no server or redis package needed
+        with mock.patch.dict(redis_cache.__dict__, {'_cache': mock.Mock(**{'get_client.return_value': client})}):
+            self.assertBurstThenRefill(redis_cache)
+
+        client.register_script.assert_called_once()
+        keys, (interval, burst) = script.calls[0]
+        self.assertEqual(keys, ['gmsp:1:bucket'])
+        self.assertEqual((interval, burst), (12, 48))
+
+
+@mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {'login_ip': '3/min', 'login_email': '2/min'})
+class LoginThrottleTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, email, ip='10.0.0.1'):
+        return APIClient().post('/api/users/login/', {'email': email, 'password': 'wrong'}, REMOTE_ADDR=ip)
+
+    def test_email_bucket_applies_across_ips(self):
+        self.assertEqual(self.login('a@example.com', '10.0.0.1').status_code, 400)
+        self.assertEqual(self.login('A@example.com', '10.0.0.2').status_code, 400)
+        response = self.login('a@example.com', '10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_ip_bucket_applies_across_emails(self):
+        for i in range(3):
+            self.assertEqual(self.login(f'user{i}@example.com').status_code, 400)
+        self.assertEqual(self.login('user9@example.com').status_code, 429)
+
+
+class RangedFileResponseTests(SimpleTestCase):
+    data = bytes(range(256)) * 4
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.mp4')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.data)
+        self.mtime = int(os.stat(self.path).st_mtime)
+
+    def get(self, **headers):
+        response = ranged_file_response(RequestFactory().get('/video/', **headers), self.path)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual((response['Accept-Ranges'], response['Content-Type']), ('bytes', 'video/mp4'))
+
+    def test_ranges(self):
+        for header, start, end in (
+            ('bytes=0-99', 0, 99), ('bytes=1000-', 1000, 1023), ('bytes=-24', 1000, 1023), ('bytes=1000-5000', 1000, 1023),
+        ):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206, header)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+            self.assertEqual(response['Content-Length'], str(end - start + 1))
+            self.assertEqual(self.body(response), self.data[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=1024-', 'bytes=-0'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_invalid_and_multiple_ranges_are_ignored(self):
+        for header in ('bytes=5-2', 'bytes=0-1,5-6', 'items=0-1', 'bytes=x-y'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200, header)
+            self.assertEqual(self.body(response), self.data)
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        for if_range, status in (
+            (etag, 206), ('"stale"', 200), (f'W/{etag}', 200),
+            (http_date(self.mtime), 206), (http_date(self.mtime - 60), 200), (http_date(self.mtime + 60), 200),
+        ):
+            response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=if_range)
+            self.assertEqual(response.status_code, status, if_range)
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
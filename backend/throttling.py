@@ -0,0 +1,120 @@
+"""Token-bucket throttles for the unauthenticated endpoints.
+
+Rates use DRF's ``"<n>/<period>"`` syntax from DEFAULT_THROTTLE_RATES:
+a bucket holds ``n`` tokens and refills evenly over ``period``, so
+clients may burst up to ``n`` requests and then one per ``period / n``.
+
+Buckets are kept with GCRA, which stores a single timestamp per key (the
+time at which the bucket will be full again). With the Redis cache
+backend the update runs as one Lua script, so all workers share a bucket
+atomically. Other backends fall back to a per-process lock; with the
+default local-memory cache every worker then has its own buckets, and a
+client gets the configured rate once per worker.
+"""
+import hashlib
+import threading
+import time
+
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import SimpleRateThrottle
+
+GCRA_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+if tat - now > burst then
+    return {0, tostring(tat - burst - now)}
+end
+tat = tat + interval
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+return {1, '0'}
+"""
+
+_lock = threading.Lock()
+_scripts = {}
+
+
+def _take_redis(cache, key, interval, burst):
+    client = cache._cache.get_client(key, write=True)
+    script = _scripts.get(id(client))
+    if script is None:
+        script = _scripts[id(client)] = client.register_script(GCRA_SCRIPT)
+    allowed, wait = script(keys=[cache.make_and_validate_key(key)], args=[interval, burst])
+    return bool(int(allowed)), float(wait)
+
+
+def _take_local(cache, key, interval, burst):
+    with _lock:
+        now = time.time()
+        tat = max(cache.get(key, now), now)
+        if tat - now > burst:
+            return False, tat - burst - now
+        tat += interval
+        cache.set(key, tat, timeout=int(tat - now) + 1)
+        return True, 0.0
+
+
+def take_token(cache, key, capacity, period):
+    """Take one token from the bucket at ``key``; return ``(allowed, seconds until one is available)``."""
+    interval = period / capacity
+    burst = period - interval
+    if isinstance(cache, RedisCache):
+        return _take_redis(cache, key, interval, burst)
+    return _take_local(cache, key, interval, burst)
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Base class, the rate is looked up as ``<view.throttle_scope>_<ident_name>``."""
+    ident_name = None
+
+    def __init__(self):
+        # The rate depends on the view, it is resolved in allow_request
+        pass
+
+    def get_ident_value(self, request):
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        if not ident:
+            return None
+        return f'throttle:{self.scope}:{ident}'
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            return True
+        self.scope = f'{scope}_{self.ident_name}'
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        allowed, self.retry_after = take_token(self.cache, key, self.num_requests, self.duration)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    ident_name = 'ip'
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    """Keyed on the posted ``email``, so rotating IPs does not help against one account."""
+    ident_name = 'email'
+
+    def get_ident_value(self, request):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not email or not isinstance(email, str):
+            return None
+        return hashlib.sha256(email.strip().lower().encode()).hexdigest()
@@ -18,11 +18,15 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from backend.media import signed_media_view, signed_prefix_media_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/media/<path:path>', signed_media_view, name='signed-media'),
+    path('api/media-dir/<str:token>/<path:path>', signed_prefix_media_view, name='signed-prefix-media'),
     path('api/users/', include('users.urls')),
     path('api/content/', include('content.urls')),
+    path('api/communication/', include('communication.urls')),
 ]
 
 # Serve media files in development
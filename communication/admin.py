@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ChatMessage
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'sender_name', 'text', 'sent_at')
+    search_fields = ('chat_id', 'text', 'sender__email')
+    raw_id_fields = ('sender',)
+    date_hierarchy = 'sent_at'
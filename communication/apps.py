@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CommunicationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'communication'
+
+    def ready(self):
+        from users.firebase.writer import writer
+        from .sync import mirror_messages
+
+        writer.on_commit(mirror_messages)
@@ -1,3 +1,40 @@
+import re
+
 from django.db import models
 
-# Create your models here.
+from users.models import User
+
+PARTICIPANTS_CHAT_ID_RE = re.compile(r'^\d+(?:-\d+)+$')
+
+
+def chat_id_for(*users):
+    """Chat id naming its participants, e.g. ``"3-7"`` for a mentor and a student."""
+    return '-'.join(str(pk) for pk in sorted({user.id for user in users}))
+
+
+def chat_participants(chat_id):
+    """Ids of the users a chat id names, None for free-form ids."""
+    if not PARTICIPANTS_CHAT_ID_RE.match(chat_id):
+        return None
+    return {int(pk) for pk in chat_id.split('-')}
+
+
+class ChatMessage(models.Model):
+    """A chat message committed to Firestore, mirrored for history and reporting."""
+    message_id = models.CharField(max_length=40, unique=True, help_text="Firestore document id")
+    chat_id = models.CharField(max_length=255)
+    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='chat_messages')
+    sender_name = models.CharField(max_length=255, blank=True)
+    text = models.TextField()
+    sent_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-sent_at', '-id']
+        indexes = [
+            models.Index(fields=['chat_id', 'sent_at']),
+            models.Index(fields=['sender', 'sent_at']),
+            models.Index(fields=['sent_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.chat_id}: {self.text[:50]}"
@@ -0,0 +1,17 @@
+from rest_framework import serializers
+
+from .models import ChatMessage
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    id = serializers.CharField(source='message_id', read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'chat_id', 'sender', 'sender_name', 'text', 'sent_at']
+        read_only_fields = fields
+
+
+class ChatActivityQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=1000, default=100)
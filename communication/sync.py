@@ -0,0 +1,35 @@
+"""Fill ChatMessage from the Firestore writer.
+
+The writer calls ``mirror_messages`` from its thread after each batch
+Firestore accepted, so the table holds exactly the committed messages
+and is written with one INSERT per batch.
+"""
+import re
+
+from django.db import close_old_connections
+
+from .models import ChatMessage
+
+CHAT_MESSAGES_RE = re.compile(r'^chats/(?P<chat_id>[^/]+)/messages$')
+
+
+def mirror_messages(writes):
+    messages = []
+    for write in writes:
+        match = CHAT_MESSAGES_RE.match(write.collection)
+        if match is None:
+            continue
+        messages.append(ChatMessage(
+            message_id=write.document_id,
+            chat_id=match['chat_id'],
+            sender_id=write.data.get('senderId'),
+            sender_name=write.data.get('senderName') or '',
+            text=write.data.get('text', ''),
+            sent_at=write.data['timestamp'],
+        ))
+    if not messages:
+        return
+    # This thread outlives requests, so it has to retire its connection itself
+    close_old_connections()
+    # A retried batch may already be stored
+    ChatMessage.objects.bulk_create(messages, batch_size=500, ignore_conflicts=True)
@@ -1,3 +1,108 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.firebase.writer import Write
+from users.models import User
+from .models import ChatMessage, chat_id_for
+from .sync import mirror_messages
+
+
+class ChatMirrorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mentor = User.objects.create_user(email='mentor@example.com', password='pass', role='mentor', is_active=True)
+        cls.student = User.objects.create_user(email='student@example.com', password='pass', role='student', is_active=True)
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def write(self, chat_id, sender, text, sent_at=None, document_id=None):
+        return Write(f'chats/{chat_id}/messages', document_id or f'{chat_id}-{text}', {
+            'text': text, 'senderId': sender.id, 'senderName': sender.email,
+            'timestamp': sent_at or timezone.now(),
+        })
+
+    def test_committed_batches_are_mirrored_once(self):
+        writes = [self.write('pair-1', self.mentor, 'hello'), self.write('pair-1', self.student, 'hi')]
+        mirror_messages(writes + [Write('other/doc/things', 'x', {'text': 'ignored'})])
+        mirror_messages(writes)  # a retried batch
+
+        self.assertEqual(ChatMessage.objects.count(), 2)
+        self.assertEqual(ChatMessage.objects.get(message_id='pair-1-hi').sender, self.student)
+
+    def test_history_is_paged_newest_first(self):
+        now = timezone.now()
+        mirror_messages([self.write('pair-1', self.mentor, f'm{i}', now + timedelta(seconds=i)) for i in range(5)])
+        self.client.force_authenticate(self.mentor)
+
+        response = self.client.get('/api/communication/chats/pair-1/messages/', {'page_size': 3})
+        self.assertEqual([m['text'] for m in response.data['results']], ['m4', 'm3', 'm2'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([m['text'] for m in response.data['results']], ['m1', 'm0'])
+
+    def test_history_is_limited_to_participants(self):
+        other = User.objects.create_user(email='other@example.com', password='pass', role='student', is_active=True)
+        chat_id = chat_id_for(self.mentor, self.student)
+        mirror_messages([self.write(chat_id, self.mentor, 'private')])
+        url = f'/api/communication/chats/{chat_id}/messages/'
+
+        # The student has not written yet, but the chat id names them
+        self.client.force_authenticate(self.student)
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+
+    def test_free_form_history_is_limited_to_senders(self):
+        mirror_messages([self.write('pair-1', self.mentor, 'private')])
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get('/api/communication/chats/pair-1/messages/').status_code, 404)
+        self.client.force_authenticate(self.mentor)
+        self.assertEqual(len(self.client.get('/api/communication/chats/pair-1/messages/').data['results']), 1)
+
+    def test_history_pages_through_messages_sent_together(self):
+        now = timezone.now()
+        mirror_messages([self.write('pair-1', self.mentor, f'm{i}', now) for i in range(7)])
+        self.client.force_authenticate(self.mentor)
+
+        texts, url = [], '/api/communication/chats/pair-1/messages/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            texts += [m['text'] for m in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(texts), [f'm{i}' for i in range(7)])
+
+    def test_activity_counts_messages_and_participants(self):
+        mirror_messages([
+            self.write('pair-1', self.mentor, 'a'), self.write('pair-1', self.student, 'b'),
+            self.write('pair-2', self.mentor, 'c'),
+            self.write('pair-3', self.mentor, 'old', timezone.now() - timedelta(days=60)),
+        ])
+        self.client.force_authenticate(self.mentor)
+        self.assertEqual(self.client.get('/api/communication/chats/activity/').status_code, 403)
+
+        self.client.force_authenticate(self.admin)
+        results = self.client.get('/api/communication/chats/activity/').data['results']
+        self.assertEqual([(c['chat_id'], c['messages']) for c in results], [('pair-1', 2), ('pair-2', 1)])
+        self.assertEqual(results[0]['participants'], sorted([self.mentor.id, self.student.id]))
+
+    def test_activity_since_is_validated(self):
+        mirror_messages([
+            self.write('pair-1', self.mentor, 'new'),
+            self.write('pair-2', self.mentor, 'old', timezone.now() - timedelta(days=3)),
+        ])
+        self.client.force_authenticate(self.admin)
+        url = '/api/communication/chats/activity/'
+        self.assertEqual(self.client.get(url, {'since': '2024-13-45T00:00'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': '0'}).status_code, 400)
 
-# Create your tests here.
+        naive = (timezone.now() - timedelta(days=1)).replace(tzinfo=None).isoformat()
+        results = self.client.get(url, {'since': naive}).data['results']
+        self.assertEqual([c['chat_id'] for c in results], ['pair-1'])
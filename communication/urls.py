@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import ChatActivityView, ChatHistoryView
+
+urlpatterns = [
+    path('chats/activity/', ChatActivityView.as_view(), name='chat-activity'),
+    path('chats/<str:chat_id>/messages/', ChatHistoryView.as_view(), name='chat-history'),
+]
@@ -1,3 +1,70 @@
-from django.shortcuts import render
+from datetime import timedelta
 
-# Create your views here.
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import generics, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from backend.pagination import ChatHistoryCursorPagination
+from .models import ChatMessage, chat_participants
+from .serializers import ChatActivityQuerySerializer, ChatMessageSerializer
+
+
+class IsAdminRole(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.role == 'admin'
+
+
+class ChatHistoryView(generics.ListAPIView):
+    """Messages of one chat, newest first, optionally filtered with ``?q=``.
+
+    Admins can read any chat. A chat id naming its participants (see
+    ``chat_id_for``) is readable by them, including before they have
+    written; a free-form chat id only by the users who have written in it.
+    """
+    serializer_class = ChatMessageSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatHistoryCursorPagination
+
+    def get_queryset(self):
+        chat_id = self.kwargs['chat_id']
+        messages = ChatMessage.objects.filter(chat_id=chat_id)
+        user = self.request.user
+        participants = chat_participants(chat_id)
+        if participants is not None:
+            allowed = user.id in participants
+        else:
+            allowed = messages.filter(sender=user).exists()
+        if user.role != 'admin' and not allowed:
+            raise Http404
+        query = self.request.query_params.get('q')
+        if query:
+            messages = messages.filter(text__icontains=query)
+        return messages
+
+
+class ChatActivityView(APIView):
+    """Most active chats since ``?since=`` (default 30 days ago), with their participants."""
+    permission_classes = [permissions.IsAuthenticated, IsAdminRole]
+
+    def get(self, request):
+        query = ChatActivityQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data.get('since') or timezone.now() - timedelta(days=30)
+        limit = query.validated_data['limit']
+
+        recent = ChatMessage.objects.filter(sent_at__gte=since)
+        chats = list(
+            recent.values('chat_id')
+            .annotate(messages=Count('id'), last_message_at=Max('sent_at'))
+            .order_by('-messages', 'chat_id')[:limit]
+        )
+        participants = {}
+        for chat_id, sender_id in (recent.filter(chat_id__in=[chat['chat_id'] for chat in chats], sender__isnull=False)
+                                   .values_list('chat_id', 'sender_id').distinct()):
+            participants.setdefault(chat_id, []).append(sender_id)
+        for chat in chats:
+            chat['participants'] = sorted(participants.get(chat['chat_id'], []))
+        return Response({'since': since, 'results': chats})
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Video, Course
+from django.utils import timezone
+from .models import Video, Course, ProcessingJob, UploadSession, MediaBlob
 
 
 @admin.register(Course)
@@ -7,21 +8,50 @@ class CourseAdmin(admin.ModelAdmin):
     list_display = ('title', 'created_by', 'created_at', 'is_active', 'video_count')
     list_filter = ('is_active', 'created_at')
     search_fields = ('title', 'description', 'created_by__email')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'video_count', 'total_duration')
     date_hierarchy = 'created_at'
     prepopulated_fields = {'slug': ('title',)}
-    
-    def video_count(self, obj):
-        return obj.videos.count()
-    video_count.short_description = 'Videos'
+    list_select_related = ('created_by',)
 
 
 @admin.register(Video)
 class VideoAdmin(admin.ModelAdmin):
-    list_display = ('title', 'course', 'uploaded_by', 'upload_date', 'is_active')
-    list_filter = ('is_active', 'upload_date', 'course')
+    list_display = ('title', 'course', 'uploaded_by', 'upload_date', 'is_active', 'hls_status')
+    list_filter = ('is_active', 'hls_status', 'upload_date', 'course')
     search_fields = ('title', 'description', 'uploaded_by__email', 'course__title')
     readonly_fields = ('upload_date',)
     date_hierarchy = 'upload_date'
     autocomplete_fields = ['course']
     list_select_related = ('course', 'uploaded_by')
+
+
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'object_id', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('object_id',)
+    readonly_fields = ('created_at', 'updated_at', 'locked_at', 'last_error')
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs')
+    def retry_jobs(self, request, queryset):
+        updated = queryset.filter(status='failed').update(status='pending', attempts=0, run_after=timezone.now())
+        self.message_user(request, f"{updated} jobs queued for retry.")
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'purpose', 'created_by', 'received', 'size', 'status', 'updated_at')
+    list_filter = ('status', 'purpose')
+    search_fields = ('filename', 'path', 'created_by__email')
+    readonly_fields = ('id', 'path', 'received', 'sha256', 'created_at', 'updated_at')
+    list_select_related = ('created_by',)
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'released_at', 'created_at')
+    list_filter = ('refcount',)
+    search_fields = ('name',)
+    readonly_fields = ('name', 'size', 'refcount', 'released_at', 'created_at')
@@ -0,0 +1,99 @@
+"""Reference counting for files in blob_storage.
+
+Every row whose file field points at a blob holds one reference. When
+the last one goes, a 'media.collect' job deletes the file after
+MEDIA_BLOB_GRACE seconds, unless a new upload of the same bytes took a
+reference in the meantime. A finalized upload that is not attached yet
+holds no reference, its session keeps the blob alive until it is
+claimed or purged. Names outside blob_storage (files stored before it
+existed) are ignored.
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from backend.storage import blob_storage
+
+from .jobs import enqueue
+from .models import MediaBlob, UploadSession
+
+
+def acquire_blob(name):
+    if not blob_storage.is_blob(name):
+        return
+    with transaction.atomic():
+        blob, created = MediaBlob.objects.select_for_update().get_or_create(
+            name=name, defaults={'refcount': 1, 'size': blob_storage.size(name)},
+        )
+        if not created:
+            blob.refcount += 1
+            blob.released_at = None
+            blob.save(update_fields=['refcount', 'released_at'])
+
+
+def release_blob(name):
+    if not blob_storage.is_blob(name):
+        return
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return
+        blob.refcount = max(blob.refcount - 1, 0)
+        if blob.refcount == 0:
+            blob.released_at = timezone.now()
+            enqueue('media.collect', blob.id, delay=settings.MEDIA_BLOB_GRACE)
+        blob.save(update_fields=['refcount', 'released_at'])
+
+
+def swap_blob(old_name, new_name):
+    """Move a reference from the file a field used to point at to its new file."""
+    if old_name == new_name:
+        return
+    acquire_blob(new_name)
+    release_blob(old_name)
+
+
+def _awaiting_claim(name):
+    return UploadSession.objects.filter(path=name, status='complete').exists()
+
+
+def collect_blob(blob_id):
+    """Delete a blob nobody references any more (the 'media.collect' job); return whether it was deleted."""
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(id=blob_id).first()
+        if blob is None or blob.refcount > 0 or _awaiting_claim(blob.name):
+            return False
+        name = blob.name
+        blob.delete()
+        transaction.on_commit(lambda: blob_storage.delete(name))
+    return True
+
+
+def collect_unreferenced(grace=None):
+    """Delete released blobs and blob files that never got a reference; return how many."""
+    grace = settings.MEDIA_BLOB_GRACE if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    count = 0
+    for blob_id in MediaBlob.objects.filter(refcount=0, released_at__lt=cutoff).values_list('id', flat=True):
+        count += collect_blob(blob_id)
+
+    # Files stored by a save that was then rolled back have no row at all,
+    # nor do finalized uploads until they are attached
+    root = blob_storage.path('blobs')
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, blob_storage.location).replace(os.sep, '/')
+            if os.path.getmtime(path) > cutoff.timestamp():
+                continue
+            if filename.endswith('.tmp') or (
+                blob_storage.is_blob(name)
+                and not MediaBlob.objects.filter(name=name).exists()
+                and not _awaiting_claim(name)
+            ):
+                os.remove(path)
+                count += 1
+    return count
@@ -0,0 +1,99 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ProcessingJob, Video
+
+logger = logging.getLogger(__name__)
+
+# Job kind -> dotted path of a callable taking the object id
+JOB_HANDLERS = {
+    'video.probe': 'content.tasks.probe_video',
+    'video.transcode': 'content.transcode.transcode_video',
+    'video.thumbnails': 'content.thumbnails.video_thumbnails',
+    'course.thumbnails': 'content.thumbnails.course_thumbnails',
+    'media.collect': 'content.blobs.collect_blob',
+}
+
+
+def enqueue(kind, object_id, delay=0):
+    """Queue a job, unless the same job is already pending.
+
+    Called inside the caller's transaction, so the job only becomes
+    visible to workers once the change that needs it has committed.
+    """
+    try:
+        with transaction.atomic():
+            return ProcessingJob.objects.create(
+                kind=kind,
+                object_id=object_id,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                max_attempts=settings.PROCESSING_JOB_MAX_ATTEMPTS,
+            )
+    except IntegrityError:
+        return None
+
+
+def claim_jobs(limit):
+    """Mark up to ``limit`` due jobs as running and return their ids."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            ProcessingJob.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', run_after__lte=now)
+            .order_by('run_after')
+            .values_list('id', flat=True)[:limit]
+        )
+        ProcessingJob.objects.filter(id__in=ids).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1
+        )
+    return ids
+
+
+def requeue_stale_jobs(timeout):
+    """Put back jobs left running by a worker that died more than ``timeout`` seconds ago."""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = ProcessingJob.objects.filter(status='running', locked_at__lt=cutoff)
+    queued = ProcessingJob.objects.filter(status='pending', kind=OuterRef('kind'), object_id=OuterRef('object_id'))
+    with transaction.atomic():
+        # A dead transcode left its video claimed, see transcode_video
+        Video.objects.filter(
+            id__in=stale.filter(kind='video.transcode').values('object_id'), hls_status='processing',
+        ).update(hls_status='pending')
+        stale.filter(Exists(queued)).update(status='failed', last_error='Worker died, superseded by a newer queued job')
+        return stale.filter(~Exists(queued)).update(status='pending')
+
+
+def run_job(job_id):
+    """Run one claimed job, scheduling a retry with exponential backoff on failure."""
+    job = ProcessingJob.objects.get(id=job_id)
+    try:
+        import_string(JOB_HANDLERS[job.kind])(job.object_id)
+    except Exception:
+        logger.exception(f"Job {job} failed (attempt {job.attempts}/{job.max_attempts})")
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            job.status = 'pending'
+            delay = settings.PROCESSING_JOB_BACKOFF * 2 ** (job.attempts - 1)
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+    else:
+        job.status = 'done'
+        job.last_error = ''
+    job.locked_at = None
+    fields = ['status', 'last_error', 'run_after', 'locked_at', 'updated_at']
+    try:
+        with transaction.atomic():
+            job.save(update_fields=fields)
+    except IntegrityError:
+        # The same job was queued again while this one ran, that one is the retry
+        job.status = 'failed'
+        job.save(update_fields=fields)
+    return job
@@ -0,0 +1,83 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from content.models import Course, Video
+from content.probe import probe
+
+
+def probe_file(item):
+    """Probe one file in a pool process; errors are returned instead of raised."""
+    video_id, path = item
+    try:
+        return video_id, probe(path), None
+    except Exception as e:
+        return video_id, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Probe videos with missing duration, resolution or bitrate in parallel and store the results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows written per bulk_update.')
+        parser.add_argument('--all', action='store_true', help='Re-probe every video, not only those missing metadata.')
+        parser.add_argument('--dry-run', action='store_true', help='Probe and report, but do not write anything.')
+
+    def handle(self, *args, **kwargs):
+        videos = Video.objects.exclude(video_file='').exclude(video_file__isnull=True)
+        if not kwargs['all']:
+            videos = videos.filter(Q(duration=0) | Q(width=0) | Q(bitrate=0))
+        items = [(v.id, v.video_file.path) for v in videos.only('id', 'video_file').iterator()]
+        total = len(items)
+        if not total:
+            self.stdout.write(self.style.SUCCESS("No videos need probing."))
+            return
+        self.stdout.write(f"Probing {total} videos with {kwargs['workers']} processes")
+
+        # Pool processes are forked and must not share our database connection
+        connections.close_all()
+
+        chunk_size = kwargs['chunk_size']
+        pending, failed, course_ids = [], 0, set()
+        started = time.monotonic()
+
+        with ProcessPoolExecutor(max_workers=kwargs['workers']) as pool:
+            for done, (video_id, info, error) in enumerate(pool.map(probe_file, items, chunksize=8), start=1):
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"Video {video_id}: {error}"))
+                else:
+                    pending.append(Video(
+                        id=video_id, duration=int(info.duration), width=info.width,
+                        height=info.height, bitrate=info.bitrate,
+                    ))
+
+                if len(pending) >= chunk_size or done == total:
+                    course_ids.update(self.write(pending, kwargs['dry_run']))
+                    pending = []
+                    rate = done / (time.monotonic() - started)
+                    self.stdout.write(f"{done}/{total} probed, {failed} failed ({rate:.1f} videos/s)")
+
+        if not kwargs['dry_run']:
+            # bulk_update skips Video.save, so course totals are recomputed here
+            Course.objects.filter(id__in=course_ids).refresh_stats()
+
+        prefix = "[dry run] would have updated" if kwargs['dry_run'] else "Updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {total - failed} videos in {time.monotonic() - started:.1f}s, {failed} failed."
+        ))
+
+    def write(self, videos, dry_run):
+        """Store one chunk of probe results and return the ids of the affected courses."""
+        if not videos:
+            return set()
+        ids = [v.id for v in videos]
+        course_ids = set(Video.objects.filter(id__in=ids).exclude(course=None).values_list('course_id', flat=True))
+        if not dry_run:
+            Video.objects.bulk_update(videos, ['duration', 'width', 'height', 'bitrate'])
+        return course_ids
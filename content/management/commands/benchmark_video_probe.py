@@ -0,0 +1,32 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from content.probe import probe, _probe_moviepy
+
+
+class Command(BaseCommand):
+    help = 'Compare the container header probe against moviepy on the given video files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=str)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def time_calls(self, func, path, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def handle(self, *args, **kwargs):
+        repeat = kwargs['repeat']
+        self.stdout.write(f"{'file':40} {'container':>9} {'header ms':>10} {'moviepy ms':>11} {'speedup':>8}")
+        for path in kwargs['paths']:
+            info = probe(path)
+            header_ms = self.time_calls(probe, path, repeat)
+            moviepy_ms = self.time_calls(_probe_moviepy, path, repeat)
+            self.stdout.write(
+                f"{path[-40:]:40} {info.container:>9} {header_ms:10.3f} {moviepy_ms:11.1f} {moviepy_ms / header_ms:7.0f}x"
+            )
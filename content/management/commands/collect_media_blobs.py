@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from content.blobs import collect_unreferenced
+
+
+class Command(BaseCommand):
+    help = 'Delete video blobs that no row references any more, including files left by rolled back saves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=None, help='Seconds a blob must have been unreferenced (default: MEDIA_BLOB_GRACE).')
+
+    def handle(self, *args, **kwargs):
+        count = collect_unreferenced(kwargs['grace'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} unreferenced blobs."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from content.uploads import purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable uploads that were abandoned or never attached, along with their files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=None, help='Seconds since the last chunk (default: UPLOAD_SESSION_TTL).')
+
+    def handle(self, *args, **kwargs):
+        count = purge_stale_sessions(kwargs['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} stale upload sessions."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from content.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored video count and total duration of courses to repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='Only recompute these courses (default: all).')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **kwargs):
+        courses = Course.objects.all()
+        if kwargs['course_ids']:
+            courses = courses.filter(id__in=kwargs['course_ids'])
+
+        fixed = courses.refresh_stats(batch_size=kwargs['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed stats for {courses.count()} courses, {fixed} were out of date."))
@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from content.jobs import claim_jobs, requeue_stale_jobs, run_job
+
+
+def _run_in_thread(job_id):
+    try:
+        return run_job(job_id)
+    finally:
+        # Each pool thread has its own connection
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run queued video processing jobs with a bounded pool of workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PROCESSING_WORKERS)
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit when no jobs are due instead of polling.')
+
+    def handle(self, *args, **kwargs):
+        workers = kwargs['workers']
+        # The heavy lifting (ffmpeg) happens in subprocesses, so threads are enough
+        # to keep several jobs going without holding the GIL.
+        pool = ThreadPoolExecutor(max_workers=workers)
+        running = set()
+        self.stdout.write(f"Processing jobs with {workers} workers")
+
+        requeued = requeue_stale_jobs(settings.PROCESSING_JOB_TIMEOUT)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs"))
+
+        try:
+            while True:
+                free = workers - len(running)
+                job_ids = claim_jobs(free) if free else []
+                for job_id in job_ids:
+                    running.add(pool.submit(_run_in_thread, job_id))
+
+                if running:
+                    done, running = wait(running, timeout=kwargs['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = future.result()
+                        style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+                        self.stdout.write(style(f"{job.kind} #{job.object_id}: {job.status}"))
+                elif kwargs['once']:
+                    break
+                else:
+                    time.sleep(kwargs['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, waiting for running jobs to finish")
+        finally:
+            pool.shutdown(wait=True)
@@ -1,27 +1,68 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
+from backend.storage import TrackedFilesMixin, blob_storage
 from users.models import User
-from moviepy import VideoFileClip
-from threading import Thread
 
 import os
+import uuid
 
 
 def video_upload_path(instance, filename):
     # Generate a path like: videos/YYYY-MM-DD/filename
+    # (blob_storage keeps only the extension, files are named by content)
     today = timezone.now().strftime('%Y-%m-%d')
     return f'videos/{today}/{filename}'
 
 
-class Course(models.Model):
+class CourseQuerySet(models.QuerySet):
+    def adjust_stats(self, course_id, videos=0, duration=0):
+        """Apply an incremental change to a course's stored video stats."""
+        if course_id is None or (not videos and not duration):
+            return
+        self.filter(pk=course_id).update(
+            video_count=Greatest(F('video_count') + videos, Value(0)),
+            total_duration=Greatest(F('total_duration') + duration, Value(0)),
+        )
+
+    def refresh_stats(self, batch_size=500):
+        """Recompute stored video stats from the videos table, returning the number of courses fixed."""
+        active = Q(videos__is_active=True)
+        courses = self.annotate(
+            actual_count=Count('videos', filter=active),
+            actual_duration=Coalesce(Sum('videos__duration', filter=active), Value(0)),
+        ).only('id', 'video_count', 'total_duration')
+
+        stale = []
+        for course in courses.iterator(chunk_size=batch_size):
+            if (course.video_count, course.total_duration) != (course.actual_count, course.actual_duration):
+                course.video_count = course.actual_count
+                course.total_duration = course.actual_duration
+                stale.append(course)
+        self.model.objects.bulk_update(stale, ['video_count', 'total_duration'], batch_size=batch_size)
+        return len(stale)
+
+
+class Course(TrackedFilesMixin, models.Model):
     title = models.CharField(max_length=255)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
     description = models.TextField(blank=True, null=True)
     thumbnail = models.ImageField(upload_to='course_thumbnails/', blank=True, null=True)
+    thumbnail_sizes = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized thumbnails by width")
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_courses')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+
+    # Denormalized totals over active videos, kept up to date by Video.save
+    video_count = models.PositiveIntegerField(default=0, editable=False)
+    total_duration = models.PositiveIntegerField(default=0, editable=False, help_text="Duration in seconds")
+
+    objects = CourseQuerySet.as_manager()
+    TRACKED_FILE_FIELDS = ('thumbnail',)
     
     def __str__(self):
         return self.title
@@ -29,18 +70,45 @@ class Course(models.Model):
     class Meta:
         ordering = ['title']
 
+    def save(self, *args, **kwargs):
+        """Save course and queue resizing of a new thumbnail."""
+        from .jobs import enqueue
 
-class Video(models.Model):
+        thumbnail_changed = self.file_changed('thumbnail', kwargs.get('update_fields'))
+        if thumbnail_changed and kwargs.get('update_fields') is None:
+            self.thumbnail_sizes = {}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if thumbnail_changed and self.thumbnail and not self.thumbnail_sizes:
+                enqueue('course.thumbnails', self.id)
+        self._remember_files()
+
+
+class Video(TrackedFilesMixin, models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
-    video_file = models.FileField(upload_to=video_upload_path)
+    video_file = models.FileField(upload_to=video_upload_path, storage=blob_storage)
     thumbnail = models.ImageField(upload_to='video_thumbnails/', blank=True, null=True)
+    thumbnail_sizes = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized thumbnails by width")
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_videos')
     upload_date = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='videos', null=True, blank=True)
     order_in_course = models.PositiveIntegerField(default=0, help_text="Order of video within the course")
     duration = models.PositiveIntegerField(default=0, help_text="Duration in seconds")
+    width = models.PositiveIntegerField(default=0, help_text="Frame width in pixels")
+    height = models.PositiveIntegerField(default=0, help_text="Frame height in pixels")
+    bitrate = models.PositiveIntegerField(default=0, help_text="Average bitrate in bits per second")
+
+    HLS_STATUS_CHOICES = (
+        ('none', 'Not requested'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+    hls_status = models.CharField(max_length=10, choices=HLS_STATUS_CHOICES, default='none')
+    hls_playlist = models.CharField(max_length=255, blank=True, help_text="HLS master playlist, relative to MEDIA_ROOT")
     
     def __str__(self):
         return self.title
@@ -50,18 +118,190 @@ class Video(models.Model):
         verbose_name = 'Video'
         verbose_name_plural = 'Videos'
 
+    STATS_FIELDS = ('course_id', 'is_active', 'duration')
+    TRACKED_FILE_FIELDS = ('video_file', 'thumbnail')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(f in instance.__dict__ for f in cls.STATS_FIELDS):
+            instance._stats_snapshot = instance._stats_fields()
+        return instance
+
+    def _stats_fields(self):
+        return {f: getattr(self, f) for f in self.STATS_FIELDS}
+
+    def _stored_stats_fields(self):
+        """Stats fields as currently stored in the database, None for a new video."""
+        if self._state.adding:
+            return None
+        snapshot = getattr(self, '_stats_snapshot', None)
+        if snapshot is None:
+            # Loaded with deferred fields or created without from_db
+            snapshot = Video.objects.filter(pk=self.pk).values(*self.STATS_FIELDS).first()
+        return snapshot
+
+    @staticmethod
+    def _stats_contribution(fields):
+        """What a video with these field values adds to its course's stats."""
+        if fields is None or fields['course_id'] is None or not fields['is_active']:
+            return None, 0, 0
+        return fields['course_id'], 1, fields['duration'] or 0
+
+    def _update_course_stats(self, old, update_fields=None):
+        new = self._stats_fields()
+        if old is not None and update_fields is not None:
+            # Fields that were not written keep their stored values
+            saved = {'course_id' if f in ('course', 'course_id') else f for f in update_fields}
+            new = {k: (v if k in saved else old[k]) for k, v in new.items()}
+
+        old_course, old_count, old_duration = self._stats_contribution(old)
+        new_course, new_count, new_duration = self._stats_contribution(new)
+        if old_course == new_course:
+            Course.objects.adjust_stats(new_course, new_count - old_count, new_duration - old_duration)
+        else:
+            Course.objects.adjust_stats(old_course, -old_count, -old_duration)
+            Course.objects.adjust_stats(new_course, new_count, new_duration)
+        self._stats_snapshot = new
+
     def save(self, *args, **kwargs):
-        """Save video and calculate duration in a background thread."""
-        super().save(*args, **kwargs)  # Save first
-
-        if self.video_file and (self.duration == 0 or not self.duration):
-            def update_duration(video_id, path):
-                try:
-                    with VideoFileClip(path) as clip:
-                        duration = int(clip.duration)
-                    Video.objects.filter(id=video_id).update(duration=duration)
-                except Exception as e:
-                    # Log error here if needed
-                    pass
-
-            Thread(target=update_duration, args=(self.id, self.video_file.path), daemon=True).start()
+        """Save video, keep course stats in sync and queue processing of new files."""
+        from .blobs import swap_blob
+        from .jobs import enqueue
+
+        update_fields = kwargs.get('update_fields')
+        file_saved = update_fields is None or 'video_file' in update_fields
+        file_changed = self.file_changed('video_file', update_fields)
+        thumbnail_changed = self.file_changed('thumbnail', update_fields)
+        if file_changed and update_fields is None:
+            # Renditions of the previous file no longer apply
+            self.hls_status = 'none'
+            self.hls_playlist = ''
+        if thumbnail_changed and update_fields is None:
+            self.thumbnail_sizes = {}
+
+        with transaction.atomic():
+            stored = self._stored_stats_fields()
+            super().save(*args, **kwargs)  # Save first
+            self._update_course_stats(stored, update_fields)
+            if file_changed:
+                swap_blob(self.loaded_file_name('video_file'), self.video_file.name)
+
+            # Processed by the run_processing_jobs worker, not the web process
+            if self.video_file and (file_changed or (file_saved and not self.duration)):
+                enqueue('video.probe', self.id)
+            if self.thumbnail and thumbnail_changed and not self.thumbnail_sizes:
+                enqueue('video.thumbnails', self.id)
+        self._remember_files()
+
+
+class ProcessingJob(models.Model):
+    """A unit of background work run by the run_processing_jobs command."""
+    KIND_CHOICES = (
+        ('video.probe', 'Probe video metadata'),
+        ('video.transcode', 'Transcode video to HLS'),
+        ('video.thumbnails', 'Generate video thumbnails'),
+        ('course.thumbnails', 'Generate course thumbnails'),
+        ('media.collect', 'Delete unreferenced media blob'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField(help_text="Primary key of the object the job works on")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} ({self.status})"
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+        constraints = [
+            # At most one queued job per object and kind. A running one does not
+            # count: it may be working on data that changed after it started.
+            models.UniqueConstraint(
+                fields=['kind', 'object_id'],
+                condition=Q(status='pending'),
+                name='unique_pending_processing_job',
+            ),
+        ]
+
+
+
+class MediaBlob(models.Model):
+    """A file in blob_storage and how many rows point at it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    released_at = models.DateTimeField(blank=True, null=True, help_text="When the last reference went away")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+class UploadSession(models.Model):
+    """A resumable upload written in byte ranges straight to its final storage path."""
+    PURPOSE_CHOICES = (
+        ('video', 'Course video'),
+        ('mentor_intro_video', 'Mentor intro video'),
+    )
+    STATUS_CHOICES = (
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+        ('failed', 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    created_by = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions',
+        help_text="Empty for anonymous mentor applications, the session id is then the only credential",
+    )
+    filename = models.CharField(max_length=255)
+    path = models.CharField(max_length=255, help_text="Storage name the chunks are written to")
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size}, {self.status})"
+
+@receiver(pre_delete, sender=Video)
+def remove_video_from_course_stats(sender, instance, **kwargs):
+    course_id, count, duration = Video._stats_contribution(instance._stored_stats_fields())
+    Course.objects.adjust_stats(course_id, -count, -duration)
+
+
+@receiver(pre_delete, sender=Video)
+def release_video_blob(sender, instance, **kwargs):
+    from .blobs import release_blob
+
+    release_blob(instance.video_file.name)
+
+
+@receiver(pre_delete, sender=Video)
+def remove_video_renditions(sender, instance, **kwargs):
+    from .transcode import remove_renditions
+
+    transaction.on_commit(lambda: remove_renditions(instance.id))
@@ -0,0 +1,224 @@
+"""Read video metadata straight from container headers.
+
+MP4/MOV (``moov/mvhd`` and ``tkhd``), AVI (``avih``) and WMV/ASF (file
+and stream properties objects) are parsed with a handful of seeks and
+small reads, without starting ffmpeg. Anything else, or a header that
+gives no duration (a fragmented MP4 without ``mehd``), falls back to
+moviepy.
+"""
+import os
+import struct
+import uuid
+from collections import namedtuple
+
+VideoInfo = namedtuple('VideoInfo', ['duration', 'width', 'height', 'bitrate', 'container'])
+
+
+class ProbeError(Exception):
+    pass
+
+
+def _guid(value):
+    return uuid.UUID(value).bytes_le
+
+
+ASF_HEADER = _guid('75B22630-668E-11CF-A6D9-00AA0062CE6C')
+ASF_FILE_PROPERTIES = _guid('8CABDCA1-A947-11CF-8EE4-00C00C205365')
+ASF_STREAM_PROPERTIES = _guid('B7DC0791-A9B7-11CF-8EE6-00C00C205365')
+ASF_VIDEO_MEDIA = _guid('BC19EFC0-5B4D-11CF-A8FD-00805F5C442B')
+
+# Top-level atoms an ISO/QuickTime file may start with
+MP4_LEADING_ATOMS = {b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip', b'pnot'}
+
+
+def sniff_container(head):
+    """Identify the container from the first bytes of a file, or return None."""
+    if len(head) >= 12 and head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'avi'
+    if head[:16] == ASF_HEADER:
+        return 'asf'
+    if len(head) >= 8 and head[4:8] in MP4_LEADING_ATOMS:
+        return 'mp4'
+    return None
+
+
+# --- MP4 / MOV ---
+
+def _mp4_boxes(f, start, end):
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ProbeError(f"Corrupt MP4 box at offset {pos}")
+        yield kind, pos + header, pos + size
+        pos += size
+
+
+def _find_box(f, start, end, kind):
+    for box_kind, body, box_end in _mp4_boxes(f, start, end):
+        if box_kind == kind:
+            return body, box_end
+    return None
+
+
+def _fragment_duration(f, moov):
+    mvex = _find_box(f, *moov, b'mvex')
+    mehd = mvex and _find_box(f, *mvex, b'mehd')
+    if not mehd:
+        raise ProbeError("Fragmented MP4 without a mehd atom")
+    f.seek(mehd[0])
+    if f.read(4)[0] == 1:
+        return struct.unpack('>Q', f.read(8))[0]
+    return struct.unpack('>I', f.read(4))[0]
+
+
+def _probe_mp4(f, size):
+    moov = _find_box(f, 0, size, b'moov')
+    if moov is None:
+        raise ProbeError("No moov atom")
+    mvhd = _find_box(f, *moov, b'mvhd')
+    if mvhd is None:
+        raise ProbeError("No mvhd atom")
+
+    f.seek(mvhd[0])
+    version = f.read(4)[0]
+    if version == 1:
+        timescale, duration = struct.unpack('>16xIQ', f.read(28))
+    else:
+        timescale, duration = struct.unpack('>8xII', f.read(16))
+    if not timescale:
+        raise ProbeError("mvhd timescale is zero")
+    if not duration:
+        # Fragmented files keep the length in mvex/mehd, if anywhere
+        duration = _fragment_duration(f, moov)
+
+    width = height = 0
+    for kind, body, end in _mp4_boxes(f, *moov):
+        if kind != b'trak':
+            continue
+        tkhd = _find_box(f, body, end, b'tkhd')
+        if tkhd is None:
+            continue
+        f.seek(tkhd[0])
+        offset = 88 if f.read(1)[0] == 1 else 76
+        f.seek(tkhd[0] + offset)
+        w, h = struct.unpack('>II', f.read(8))
+        if w and h:
+            width, height = w >> 16, h >> 16  # 16.16 fixed point
+            break
+
+    return duration / timescale, width, height
+
+
+# --- AVI ---
+
+def _riff_chunks(f, start, end):
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        kind, size = struct.unpack('<4sI', f.read(8))
+        list_type = f.read(4) if kind == b'LIST' else None
+        yield kind, list_type, pos + 8, pos + 8 + size
+        pos += 8 + size + (size & 1)  # chunks are word aligned
+
+
+def _probe_avi(f, size):
+    for kind, list_type, body, end in _riff_chunks(f, 12, size):
+        if kind == b'LIST' and list_type == b'hdrl':
+            break
+    else:
+        raise ProbeError("No hdrl list")
+
+    total_frames = None
+    usec_per_frame = width = height = 0
+    for kind, list_type, chunk_body, chunk_end in _riff_chunks(f, body + 4, end):
+        if kind == b'avih':
+            f.seek(chunk_body)
+            fields = struct.unpack('<10I', f.read(40))
+            usec_per_frame, total_frames, width, height = fields[0], fields[4], fields[8], fields[9]
+        elif kind == b'LIST' and list_type == b'odml':
+            # OpenDML files (> 1 GB) keep the real frame count here
+            for sub_kind, _, sub_body, _ in _riff_chunks(f, chunk_body + 4, chunk_end):
+                if sub_kind == b'dmlh':
+                    f.seek(sub_body)
+                    total_frames = struct.unpack('<I', f.read(4))[0]
+    if total_frames is None:
+        raise ProbeError("No avih chunk")
+    return total_frames * usec_per_frame / 1_000_000, width, height
+
+
+# --- WMV / ASF ---
+
+def _probe_asf(f, size):
+    f.seek(16)
+    header_size, count = struct.unpack('<QI', f.read(12))
+    pos, end = 30, min(header_size, size)
+
+    duration = None
+    width = height = 0
+    for _ in range(count):
+        if pos + 24 > end:
+            break
+        f.seek(pos)
+        guid = f.read(16)
+        obj_size = struct.unpack('<Q', f.read(8))[0]
+        if obj_size < 24:
+            raise ProbeError(f"Corrupt ASF object at offset {pos}")
+        if guid == ASF_FILE_PROPERTIES:
+            f.seek(pos + 24 + 40)
+            play_duration, _, preroll = struct.unpack('<QQQ', f.read(24))
+            duration = play_duration / 10_000_000 - preroll / 1000
+        elif guid == ASF_STREAM_PROPERTIES and not width:
+            f.seek(pos + 24)
+            stream_type = f.read(16)
+            if stream_type == ASF_VIDEO_MEDIA:
+                f.seek(pos + 24 + 54)
+                width, height = struct.unpack('<II', f.read(8))
+        pos += obj_size
+
+    if duration is None:
+        raise ProbeError("No ASF file properties object")
+    return max(duration, 0), width, height
+
+
+PARSERS = {
+    'mp4': _probe_mp4,
+    'avi': _probe_avi,
+    'asf': _probe_asf,
+}
+
+
+def _probe_moviepy(path):
+    from moviepy import VideoFileClip
+
+    with VideoFileClip(path) as clip:
+        width, height = clip.size
+        return clip.duration, width, height
+
+
+def probe(path):
+    """Return a VideoInfo for the file at ``path``."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        container = sniff_container(f.read(16))
+        if container is not None:
+            try:
+                duration, width, height = PARSERS[container](f, size)
+                if not duration:
+                    raise ProbeError("Header has no duration")
+            except (ProbeError, struct.error, IndexError):
+                container = None
+
+    if container is None:
+        duration, width, height = _probe_moviepy(path)
+        container = 'other'
+
+    bitrate = int(size * 8 / duration) if duration else 0
+    return VideoInfo(duration, width, height, bitrate, container)
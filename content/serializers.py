@@ -1,19 +1,31 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
-from .models import Video, Course
+from .models import Video, Course, UploadSession
+from .uploads import UploadError, claim_upload
 from users.serializers import UserSerializer
+from backend.media import media_url, signed_prefix_url
+
+
+def thumbnail_size_urls(obj, request):
+    """Map of width to absolute URL for the resized thumbnails of a course or video."""
+    if request is None:
+        return {}
+    return {width: request.build_absolute_uri(default_storage.url(path)) for width, path in obj.thumbnail_sizes.items()}
 
 
 class CourseListSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     thumbnail_url = serializers.SerializerMethodField()
-    video_count = serializers.SerializerMethodField()
-    duration = serializers.SerializerMethodField()  # NEW
+    thumbnail_sizes = serializers.SerializerMethodField()
+    duration = serializers.IntegerField(source='total_duration', read_only=True)
     
     class Meta:
         model = Course
-        fields = ['id', 'title', 'slug', 'description', 'thumbnail', 'thumbnail_url', 
+        fields = ['id', 'title', 'slug', 'description', 'thumbnail', 'thumbnail_url', 'thumbnail_sizes',
                   'created_by', 'created_at', 'is_active', 'video_count','duration']
-        read_only_fields = ['created_at', 'created_by', 'slug']
+        read_only_fields = ['created_at', 'created_by', 'slug', 'video_count']
     
     def get_thumbnail_url(self, obj):
         if obj.thumbnail:
@@ -22,10 +34,8 @@ class CourseListSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.thumbnail.url)
         return None
     
-    def get_video_count(self, obj):
-        return obj.videos.filter(is_active=True).count()
-    def get_duration(self, obj):
-        return sum(obj.videos.filter(is_active=True).values_list('duration', flat=True))
+    def get_thumbnail_sizes(self, obj):
+        return thumbnail_size_urls(obj, self.context.get('request'))
 
 
 class CourseDetailSerializer(CourseListSerializer):
@@ -35,7 +45,7 @@ class CourseDetailSerializer(CourseListSerializer):
         fields = CourseListSerializer.Meta.fields + ['videos']
     
     def get_videos(self, obj):
-        videos = obj.videos.filter(is_active=True).order_by('order_in_course')
+        videos = obj.videos.filter(is_active=True).select_related('uploaded_by', 'course').order_by('order_in_course')
         return VideoSerializer(videos, many=True, context=self.context).data
 
 
@@ -62,22 +72,35 @@ class CourseCreateUpdateSerializer(serializers.ModelSerializer):
 class VideoSerializer(serializers.ModelSerializer):
     uploaded_by = UserSerializer(read_only=True)
     video_file_url = serializers.SerializerMethodField()
+    hls_playlist_url = serializers.SerializerMethodField()
     thumbnail_url = serializers.SerializerMethodField()
+    thumbnail_sizes = serializers.SerializerMethodField()
     course_title = serializers.SerializerMethodField()
     
     
     class Meta:
         model = Video
-        fields = ['id', 'title', 'description', 'video_file', 'video_file_url', 
-                  'thumbnail', 'thumbnail_url', 'course', 'course_title', 'order_in_course',
-                  'uploaded_by', 'upload_date', 'is_active','duration']
-        read_only_fields = ['upload_date', 'uploaded_by']
+        fields = ['id', 'title', 'description', 'video_file', 'video_file_url', 'hls_status', 'hls_playlist_url',
+                  'thumbnail', 'thumbnail_url', 'thumbnail_sizes', 'course', 'course_title', 'order_in_course',
+                  'uploaded_by', 'upload_date', 'is_active','duration', 'width', 'height', 'bitrate']
+        read_only_fields = ['upload_date', 'uploaded_by', 'width', 'height', 'bitrate', 'hls_status']
+        # Only the (signed) video_file_url is handed out
+        extra_kwargs = {'video_file': {'write_only': True}}
     
     def get_video_file_url(self, obj):
         if obj.video_file:
             request = self.context.get('request')
             if request is not None:
-                return request.build_absolute_uri(obj.video_file.url)
+                return request.build_absolute_uri(media_url(obj.video_file))
+        return None
+    
+    def get_hls_playlist_url(self, obj):
+        # Segments are referenced relative to the playlist, so the whole directory is signed
+        if obj.hls_status == 'ready' and obj.hls_playlist:
+            request = self.context.get('request')
+            if request is not None:
+                directory, playlist = obj.hls_playlist.rsplit('/', 1)
+                return request.build_absolute_uri(signed_prefix_url(directory, playlist, settings.MEDIA_HLS_URL_TTL))
         return None
     
     def get_thumbnail_url(self, obj):
@@ -87,6 +110,9 @@ class VideoSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.thumbnail.url)
         return None
     
+    def get_thumbnail_sizes(self, obj):
+        return thumbnail_size_urls(obj, self.context.get('request'))
+    
     def get_course_title(self, obj):
         if obj.course:
             return obj.course.title
@@ -94,10 +120,30 @@ class VideoSerializer(serializers.ModelSerializer):
 
 
 class VideoUploadSerializer(serializers.ModelSerializer):
+    # A finalized resumable upload can be given instead of video_file
+    upload_id = serializers.UUIDField(write_only=True, required=False)
+
     class Meta:
         model = Video
-        fields = ['title', 'description', 'video_file', 'thumbnail', 'course', 'order_in_course']
-    
+        fields = ['title', 'description', 'video_file', 'thumbnail', 'course', 'order_in_course', 'upload_id']
+        extra_kwargs = {'video_file': {'required': False, 'write_only': True}}
+
+    def validate(self, data):
+        if data.get('upload_id') and data.get('video_file'):
+            raise serializers.ValidationError("Provide either video_file or upload_id, not both.")
+        if self.instance is None and not data.get('upload_id') and not data.get('video_file'):
+            raise serializers.ValidationError({"video_file": "This field is required."})
+        return data
+
+    def attach_upload(self, validated_data):
+        """Point video_file at a finished upload, the file is not copied."""
+        upload_id = validated_data.pop('upload_id', None)
+        if upload_id:
+            try:
+                validated_data['video_file'] = claim_upload(upload_id, 'video', self.context['request'].user)
+            except UploadError as e:
+                raise serializers.ValidationError({"upload_id": str(e)})
+
     def create(self, validated_data):
         # Get the current user from the context
         user = self.context['request'].user
@@ -106,10 +152,31 @@ class VideoUploadSerializer(serializers.ModelSerializer):
         if user.role != 'admin':
             raise serializers.ValidationError("Only admin users can upload videos.")
         
-        # Create the video with the current user as uploader
-        video = Video.objects.create(
-            uploaded_by=user,
-            **validated_data
-        )
+        with transaction.atomic():
+            self.attach_upload(validated_data)
+            # Create the video with the current user as uploader (perform_create may pass it too)
+            validated_data['uploaded_by'] = user
+            video = Video.objects.create(**validated_data)
         
-        return video
\ No newline at end of file
+        return video
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.attach_upload(validated_data)
+            return super().update(instance, validated_data)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'purpose', 'filename', 'size', 'offset', 'sha256', 'status', 'created_at']
+        read_only_fields = fields
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    purpose = serializers.ChoiceField(choices=UploadSession.PURPOSE_CHOICES)
+    filename = serializers.CharField(max_length=200)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
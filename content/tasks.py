@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import transaction
+
+from .jobs import enqueue
+from .models import Video
+from .probe import probe
+
+
+def probe_video(video_id):
+    """Read duration, resolution and bitrate of an uploaded video and store them."""
+    video = Video.objects.filter(id=video_id).first()
+    if video is None or not video.video_file:
+        return
+
+    info = probe(video.video_file.path)
+
+    with transaction.atomic():
+        # Reloaded under the lock, so the course stats change is computed
+        # from the row as stored, not as it was before probing
+        locked = Video.objects.select_for_update().filter(id=video_id).first()
+        if locked is None or locked.video_file.name != video.video_file.name:
+            # The file was replaced while probing, the job queued for the new one takes over
+            return
+        locked.duration = int(info.duration)
+        locked.width = info.width
+        locked.height = info.height
+        locked.bitrate = info.bitrate
+        fields = ['duration', 'width', 'height', 'bitrate']
+        # Renditions are chosen from the source height, so transcoding waits for the probe
+        if settings.VIDEO_HLS_ENABLED and locked.hls_status in ('none', 'failed'):
+            locked.hls_status = 'pending'
+            fields.append('hls_status')
+            enqueue('video.transcode', locked.id)
+        # A poster frame is picked relative to the duration
+        if not locked.thumbnail:
+            enqueue('video.thumbnails', locked.id)
+        locked.save(update_fields=fields)
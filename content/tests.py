@@ -1,3 +1,885 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from datetime import timedelta
+from urllib.parse import urljoin
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+from rest_framework.test import APIClient
+
+from users.models import User
+from . import probe as video_probe
+from . import tasks, transcode
+from .blobs import collect_unreferenced
+from .jobs import claim_jobs, requeue_stale_jobs, run_job
+from .models import Video, Course, MediaBlob, ProcessingJob, UploadSession
+from .probe import ASF_FILE_PROPERTIES, ASF_HEADER, ASF_STREAM_PROPERTIES, ASF_VIDEO_MEDIA, VideoInfo
+from .thumbnails import _output_format, course_thumbnails, video_thumbnails
+from .transcode import ffmpeg_path
+from .uploads import UploadError, claim_upload, create_session, finalize_session, purge_stale_sessions, write_chunk
+
+
+class CourseCatalogQueryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='pass', role='admin', is_active=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_courses(self, count, videos_per_course=3):
+        start = Course.objects.count()
+        for i in range(start, start + count):
+            course = Course.objects.create(
+                title=f'Course {i}', slug=f'course-{i}', created_by=self.admin
+            )
+            for j in range(videos_per_course):
+                Video.objects.create(
+                    title=f'Video {i}.{j}', video_file='', course=course,
+                    uploaded_by=self.admin, duration=60, is_active=j != 0,
+                )
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/content/courses/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_is_constant(self):
+        self.create_courses(2)
+        small, _ = self.count_list_queries()
+        self.create_courses(10)
+        large, _ = self.count_list_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(large, 1)
+
+    def test_list_reports_active_totals(self):
+        self.create_courses(1)
+        _, response = self.count_list_queries()
+        course = response.json()['results'][0]
+        self.assertEqual(course['video_count'], 2)
+        self.assertEqual(course['duration'], 120)
+        self.assertEqual(course['created_by']['email'], 'admin@example.com')
+
+    def test_detail_query_count_is_constant(self):
+        self.create_courses(1, videos_per_course=2)
+        course = Course.objects.get()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(f'/api/content/courses/{course.id}/')
+        for j in range(10):
+            Video.objects.create(
+                title=f'Extra {j}', video_file='', course=course,
+                uploaded_by=self.admin, duration=60,
+            )
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(f'/api/content/courses/{course.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class CourseStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.first = Course.objects.create(title='First', slug='first', created_by=self.admin)
+        self.second = Course.objects.create(title='Second', slug='second', created_by=self.admin)
+
+    def create_video(self, course, duration=60, **kwargs):
+        return Video.objects.create(
+            title='Video', video_file='', course=course, uploaded_by=self.admin, duration=duration, **kwargs
+        )
+
+    def assertStatsMatchVideos(self):
+        for course in Course.objects.all():
+            active = Video.objects.filter(course=course, is_active=True)
+            self.assertEqual(
+                (course.video_count, course.total_duration),
+                (active.count(), sum(active.values_list('duration', flat=True))),
+                course.title,
+            )
+
+    def test_probe_racing_a_course_move(self):
+        video = Video.objects.create(
+            title='Video', video_file='blobs/aa/aa/lecture.mp4', course=self.first, uploaded_by=self.admin,
+        )
+
+        def move_while_probing(path):
+            moved = Video.objects.get(id=video.id)
+            moved.course = self.second
+            moved.save()
+            return VideoInfo(90, 640, 360, 1000, 'mp4')
+
+        with mock.patch.object(tasks, 'probe', side_effect=move_while_probing):
+            tasks.probe_video(video.id)
+        self.assertEqual(Video.objects.get(id=video.id).duration, 90)
+        self.assertStatsMatchVideos()
+
+    def test_create_and_delete(self):
+        video = self.create_video(self.first, 30)
+        self.create_video(self.first, 45)
+        self.create_video(self.first, 10, is_active=False)
+        self.assertStatsMatchVideos()
+
+        video.delete()
+        self.assertStatsMatchVideos()
+        Video.objects.filter(course=self.first).delete()
+        self.assertStatsMatchVideos()
+        self.assertEqual(Course.objects.get(pk=self.first.pk).video_count, 0)
+
+    def test_move_between_courses(self):
+        video = self.create_video(self.first, 30)
+        self.create_video(self.second, 20)
+
+        video.course = self.second
+        video.save()
+        self.assertStatsMatchVideos()
+
+        video.course = self.first
+        video.save(update_fields=['course'])
+        self.assertStatsMatchVideos()
+
+        video.course = None
+        video.save()
+        self.assertStatsMatchVideos()
+
+    def test_toggle_active_and_change_duration(self):
+        video = self.create_video(self.first, 30)
+
+        video.is_active = False
+        video.save()
+        self.assertStatsMatchVideos()
+
+        video.duration = 90
+        video.save(update_fields=['duration'])
+        self.assertStatsMatchVideos()
+
+        video.is_active = True
+        video.save(update_fields=['is_active'])
+        self.assertStatsMatchVideos()
+
+        video.duration = 15
+        video.title = 'Renamed'
+        video.save(update_fields=['title'])  # duration not written, stats keep the stored value
+        self.assertStatsMatchVideos()
+        video.save()
+        self.assertStatsMatchVideos()
+
+    def test_deferred_and_unsnapshotted_instances(self):
+        video = self.create_video(self.first, 30)
+
+        deferred = Video.objects.only('id', 'title').get(pk=video.pk)
+        deferred.delete()
+        self.assertStatsMatchVideos()
+
+        video = self.create_video(self.first, 30)
+        detached = Video(pk=video.pk, title='Video', video_file='', course=self.second,
+                         uploaded_by=self.admin, duration=50, upload_date=video.upload_date)
+        detached._state.adding = False
+        detached.save()
+        self.assertStatsMatchVideos()
+
+    def test_refresh_stats_repairs_drift(self):
+        self.create_video(self.first, 30)
+        Course.objects.filter(pk=self.first.pk).update(video_count=7, total_duration=1)
+
+        self.assertEqual(Course.objects.refresh_stats(), 1)
+        self.assertStatsMatchVideos()
+
+
+class CourseOrderPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+        cls.course = Course.objects.create(title='Course', slug='course', created_by=cls.admin)
+        # Past DRF's offset_cutoff of 1000 rows sharing one position
+        Video.objects.bulk_create([
+            Video(title=f'Video {i}', video_file='', course=cls.course, uploaded_by=cls.admin,
+                  order_in_course=0 if i < 1300 else i % 3)
+            for i in range(1330)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def walk(self, url, direction):
+        ids = []
+        for _ in range(20):  # a broken cursor can loop forever
+            if not url:
+                break
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = [video['id'] for video in response.data['results']]
+            ids = page + ids if direction == 'previous' else ids + page
+            last_url, url = url, response.data[direction]
+        else:
+            self.fail(f"Still paging {direction} after 20 pages")
+        return ids, last_url
+
+    def test_pages_cover_ties_in_course_order(self):
+        expected = list(Video.objects.filter(course=self.course).order_by('order_in_course', 'id').values_list('id', flat=True))
+
+        forward, last_page = self.walk(f'/api/content/videos/by_course/?course_id={self.course.id}&page_size=200', 'next')
+        self.assertEqual(forward, expected)
+
+        response = self.client.get(last_page)
+        backward, _ = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(backward + [video['id'] for video in response.data['results']], expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'/api/content/courses/{self.course.id}/videos/', {'cursor': 'cD1ub3Rqc29u'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_SIGNED_URLS=True)
+class VideoMediaUrlTests(TestCase):
+    def test_only_signed_file_url_is_exposed(self):
+        admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+        video = Video.objects.create(title='Video', video_file='blobs/ab/cd/abcd.mp4', uploaded_by=admin, duration=60)
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        data = client.get(f'/api/content/videos/{video.id}/').json()
+        self.assertNotIn('video_file', data)
+        self.assertIn('signature=', data['video_file_url'])
+        self.assertIn('/api/media/', data['video_file_url'])
+
+
+class ProcessingJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.video = Video.objects.create(title='Video', video_file='blobs/aa/aa/old.mp4', uploaded_by=self.admin)
+        self.running = ProcessingJob.objects.get(kind='video.probe', object_id=self.video.id)
+        self.assertEqual(claim_jobs(10), [self.running.id])
+
+    def replace_file(self):
+        self.video.video_file = 'blobs/bb/bb/new.mp4'
+        self.video.save()
+
+    def test_replacing_a_file_during_its_probe_queues_another(self):
+        self.replace_file()
+        statuses = ProcessingJob.objects.filter(kind='video.probe', object_id=self.video.id).values_list('status', flat=True)
+        self.assertEqual(sorted(statuses), ['pending', 'running'])
+
+        self.replace_file()  # still one queued job
+        self.assertEqual(ProcessingJob.objects.filter(kind='video.probe', status='pending').count(), 1)
+
+    def test_probe_of_a_replaced_file_is_discarded(self):
+        def probe_then_replace(path):
+            self.replace_file()
+            return VideoInfo(42, 640, 360, 1000, 'mp4')
+
+        with mock.patch.object(tasks, 'probe', side_effect=probe_then_replace):
+            run_job(self.running.id)
+        self.video.refresh_from_db()
+        self.assertEqual((self.video.duration, self.video.width), (0, 0))
+
+    def test_failed_job_superseded_by_queued_one(self):
+        self.replace_file()
+        with mock.patch.object(tasks, 'probe', side_effect=OSError('unreadable')), self.assertLogs('content.jobs', 'ERROR'):
+            job = run_job(self.running.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(ProcessingJob.objects.filter(kind='video.probe', status='pending').count(), 1)
+
+    def test_stale_jobs_are_requeued_unless_superseded(self):
+        other = Video.objects.create(title='Other', video_file='blobs/cc/cc/other.mp4', uploaded_by=self.admin)
+        other_job = ProcessingJob.objects.get(kind='video.probe', object_id=other.id)
+        claim_jobs(10)
+        self.replace_file()
+        ProcessingJob.objects.filter(status='running').update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        self.running.refresh_from_db()
+        other_job.refresh_from_db()
+        self.assertEqual((self.running.status, other_job.status), ('failed', 'pending'))
+
+
+class HlsUrlTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+        admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+        self.videos = []
+        for title in ('One', 'Two'):
+            video = Video.objects.create(title=title, video_file='', uploaded_by=admin)
+            directory = os.path.join(self.media_root, 'hls', str(video.id), '0')
+            os.makedirs(directory)
+            with open(os.path.join(directory, '..', 'master.m3u8'), 'w') as f:
+                f.write('#EXTM3U\n0/index.m3u8\n')
+            with open(os.path.join(directory, 'index.m3u8'), 'w') as f:
+                f.write('#EXTM3U\nsegment_0000.ts\n')
+            with open(os.path.join(directory, 'segment_0000.ts'), 'wb') as f:
+                f.write(b'G' * 188)
+            Video.objects.filter(id=video.id).update(hls_status='ready', hls_playlist=f'hls/{video.id}/master.m3u8')
+            self.videos.append(video)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        self.playlist = self.client.get(f'/api/content/videos/{self.videos[0].id}/').json()['hls_playlist_url']
+
+    def test_playlist_and_relative_segments_are_served(self):
+        self.assertNotIn('/media/hls', self.playlist)
+        self.assertEqual(b''.join(self.client.get(self.playlist).streaming_content), b'#EXTM3U\n0/index.m3u8\n')
+        variant = urljoin(self.playlist, '0/index.m3u8')
+        self.assertEqual(self.client.get(variant).status_code, 200)
+        segment = self.client.get(urljoin(variant, 'segment_0000.ts'))
+        self.assertEqual(segment.status_code, 200)
+        self.assertEqual(segment['Content-Type'], 'video/mp2t')
+
+    def test_token_is_scoped_to_its_directory(self):
+        other = self.playlist.replace(f'/hls/{self.videos[0].id}/', f'/hls/{self.videos[1].id}/')
+        self.assertEqual(self.client.get(other).status_code, 403)
+        escape = self.playlist.replace('master.m3u8', f'../{self.videos[1].id}/master.m3u8')
+        self.assertEqual(self.client.get(escape).status_code, 404)
+        tampered = self.playlist.replace('.2.', '.1.', 1)  # widen the scope to all of hls/
+        self.assertEqual(self.client.get(tampered).status_code, 403)
+
+
+class ChunkedUploadTests(TestCase):
+    data = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+        cls.other = User.objects.create_user(email='other@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        response = self.client.post('/api/content/uploads/', {
+            'purpose': 'video', 'filename': 'lecture.mp4', 'size': len(self.data),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.session = UploadSession.objects.get(id=response.json()['id'])
+        self.url = f'/api/content/uploads/{self.session.id}/'
+
+    def put(self, start, end):
+        return self.client.put(
+            self.url, self.data[start:end + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.data)}',
+        )
+
+    def upload(self):
+        for start in range(0, len(self.data), 4096):
+            self.assertEqual(self.put(start, min(start + 4095, len(self.data) - 1)).status_code, 200)
+        return self.client.post(self.url + 'finalize/', {'sha256': hashlib.sha256(self.data).hexdigest()}, format='json')
+
+    def test_upload_is_adopted_as_blob(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'complete')
+        self.assertTrue(self.session.path.startswith('blobs/'))
+        with open(os.path.join(self.media_root, self.session.path), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_range_not_at_offset_is_rejected(self):
+        self.assertEqual(self.put(0, 4095).status_code, 200)
+        for start, end in ((8192, 10251), (0, 4095), (100, 4195)):  # ahead, duplicate, overlapping
+            response = self.put(start, end)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response['Upload-Offset'], '4096')
+            self.assertEqual(response.json()['offset'], 4096)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.received, 4096)
+        with open(os.path.join(self.media_root, self.session.path), 'rb') as f:
+            self.assertEqual(f.read(), self.data[:4096])
+
+    def test_checksum_mismatch_fails_the_upload(self):
+        for start in range(0, len(self.data), 4096):
+            self.put(start, min(start + 4095, len(self.data) - 1))
+        response = self.client.post(self.url + 'finalize/', {'sha256': '0' * 64}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, 'failed')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, self.session.path)))
+        self.assertEqual(self.put(0, 4095).status_code, 400)
+
+    def test_upload_is_claimed_by_its_owner_only(self):
+        self.upload()
+        self.session.refresh_from_db()
+        with transaction.atomic(), self.assertRaises(UploadError):
+            claim_upload(self.session.id, 'video', self.other)
+        with transaction.atomic():
+            self.assertEqual(claim_upload(self.session.id, 'video', self.admin), self.session.path)
+        with transaction.atomic(), self.assertRaises(UploadError):
+            claim_upload(self.session.id, 'video', self.admin)
+
+    def test_other_user_cannot_write_to_session(self):
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.put(0, 4095).status_code, 404)
+
+    def test_purge_keeps_a_blob_another_upload_waits_for(self):
+        self.upload()
+        other = create_session('video', 'copy.mp4', len(self.data), user=self.admin)
+        write_chunk(other.id, f'bytes 0-{len(self.data) - 1}/{len(self.data)}', ContentFile(self.data))
+        other = finalize_session(other.id, hashlib.sha256(self.data).hexdigest())
+        self.session.refresh_from_db()
+        self.assertEqual(other.path, self.session.path)
+        path = os.path.join(self.media_root, other.path)
+
+        UploadSession.objects.filter(id=self.session.id).update(updated_at=timezone.now() - timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(purge_stale_sessions(3600), 1)
+        self.assertTrue(os.path.exists(path))
+
+        UploadSession.objects.filter(id=other.id).update(updated_at=timezone.now() - timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(purge_stale_sessions(3600), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_signed_in_applicant_claims_own_upload(self):
+        applicant = User.objects.create_user(email='applicant@example.com', password='pass', role='student', is_active=True)
+        self.client.force_authenticate(applicant)
+        session = self.client.post('/api/content/uploads/', {
+            'purpose': 'mentor_intro_video', 'filename': 'intro.mp4', 'size': len(self.data),
+        }, format='json').json()
+        self.url = f"/api/content/uploads/{session['id']}/"
+        self.assertEqual(self.upload().status_code, 200)
+
+        response = self.client.post('/api/users/register/mentor/', {
+            'email': 'mentor@example.com', 'first_name': 'Ada', 'last_name': 'L', 'upload_id': session['id'],
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(User.objects.get(email='mentor@example.com').mentor_intro_video.name.startswith('blobs/'))
+        self.assertEqual(UploadSession.objects.get(id=session['id']).status, 'attached')
+
+    def test_stale_sessions_are_purged(self):
+        self.put(0, 4095)
+        path = os.path.join(self.media_root, self.session.path)
+        self.assertEqual(purge_stale_sessions(3600), 0)
+        UploadSession.objects.filter(id=self.session.id).update(updated_at=timezone.now() - timedelta(hours=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(purge_stale_sessions(3600), 1)
+        self.assertFalse(UploadSession.objects.filter(id=self.session.id).exists())
+        self.assertFalse(os.path.exists(path))
+
+
+class BlobStorageTests(TestCase):
+    data = b'\x00\x00\x00\x18ftypmp42' + b'lecture' * 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+    def video(self, data=None):
+        return Video.objects.create(
+            title='Lecture', video_file=ContentFile(data or self.data, name='lecture.mp4'), uploaded_by=self.admin,
+        )
+
+    def blob_path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def age(self, blob):
+        MediaBlob.objects.filter(id=blob.id).update(released_at=timezone.now() - timedelta(hours=2))
+
+    def test_same_bytes_are_stored_once(self):
+        first, second = self.video(), self.video()
+        self.assertEqual(first.video_file.name, second.video_file.name)
+        self.assertEqual(os.listdir(os.path.dirname(self.blob_path(first.video_file.name))), [os.path.basename(first.video_file.name)])
+        self.assertEqual(MediaBlob.objects.get(name=first.video_file.name).refcount, 2)
+
+    def test_replacing_a_file_releases_the_old_blob(self):
+        video = self.video()
+        old = video.video_file.name
+        video.video_file = ContentFile(b'\x00\x00\x00\x18ftypisom' + b'other' * 100, name='other.mp4')
+        video.save()
+        blob = MediaBlob.objects.get(name=old)
+        self.assertEqual(blob.refcount, 0)
+        self.assertIsNotNone(blob.released_at)
+        self.assertTrue(ProcessingJob.objects.filter(kind='media.collect', object_id=blob.id).exists())
+        self.assertEqual(MediaBlob.objects.get(name=video.video_file.name).refcount, 1)
+
+    def test_released_blob_is_collected_after_grace(self):
+        video = self.video()
+        name = video.video_file.name
+        video.delete()
+        blob = MediaBlob.objects.get(name=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect_unreferenced(3600), 0)
+        self.assertTrue(os.path.exists(self.blob_path(name)))
+        self.age(blob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect_unreferenced(3600), 1)
+        self.assertFalse(MediaBlob.objects.filter(id=blob.id).exists())
+        self.assertFalse(os.path.exists(self.blob_path(name)))
+
+    def test_reupload_within_grace_keeps_the_blob(self):
+        video = self.video()
+        name = video.video_file.name
+        video.delete()
+        blob = MediaBlob.objects.get(name=name)
+        self.age(blob)
+        self.video()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        self.assertIsNone(blob.released_at)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect_unreferenced(0), 0)
+        self.assertTrue(os.path.exists(self.blob_path(name)))
+
+    def finalized_upload(self):
+        session = create_session('video', 'lecture.mp4', len(self.data), user=self.admin)
+        write_chunk(session.id, f'bytes 0-{len(self.data) - 1}/{len(self.data)}', ContentFile(self.data))
+        return finalize_session(session.id, hashlib.sha256(self.data).hexdigest())
+
+    def test_unclaimed_upload_is_not_collected(self):
+        session = self.finalized_upload()
+        path = self.blob_path(session.path)
+        old = (timezone.now() - timedelta(hours=2)).timestamp()
+        os.utime(path, (old, old))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect_unreferenced(3600), 0)
+        self.assertTrue(os.path.exists(path))
+
+        with transaction.atomic():
+            video = Video.objects.create(
+                title='Lecture', video_file=claim_upload(session.id, 'video', self.admin), uploaded_by=self.admin,
+            )
+        self.assertEqual(MediaBlob.objects.get(name=video.video_file.name).refcount, 1)
+
+    def test_upload_of_released_blob_is_not_collected(self):
+        video = self.video()
+        video.delete()
+        blob = MediaBlob.objects.get(name=video.video_file.name)
+        self.age(blob)
+        session = self.finalized_upload()
+        self.assertEqual(session.path, blob.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(collect_unreferenced(3600), 0)
+        self.assertTrue(os.path.exists(self.blob_path(blob.name)))
+        self.assertTrue(MediaBlob.objects.filter(id=blob.id).exists())
+
+
+def mp4_box(kind, body):
+    return struct.pack('>I4s', 8 + len(body), kind) + body
+
+
+def mp4_file(duration, timescale=1000, version=0, brand=b'isom', fragment_duration=None):
+    """A moov with an mvhd and one video track of 640x360, followed by an empty mdat."""
+    if version == 1:
+        mvhd = struct.pack('>B3xQQIQ', 1, 0, 0, timescale, duration)
+        tkhd = struct.pack('>B3xQQI4xQ', 1, 0, 0, 1, 0)
+    else:
+        mvhd = struct.pack('>B3xIIII', 0, 0, 0, timescale, duration)
+        tkhd = struct.pack('>B3xIII4xI', 0, 0, 0, 1, 0)
+    mvhd += bytes(80)
+    tkhd += bytes(52) + struct.pack('>II', 640 << 16, 360 << 16)
+    moov = mp4_box(b'mvhd', mvhd) + mp4_box(b'trak', mp4_box(b'tkhd', tkhd))
+    if fragment_duration is not None:
+        moov += mp4_box(b'mvex', mp4_box(b'mehd', struct.pack('>B3xI', 0, fragment_duration)))
+    return mp4_box(b'ftyp', brand + bytes(4)) + mp4_box(b'moov', moov) + mp4_box(b'mdat', bytes(100))
+
+
+def avi_file(frames, usec_per_frame=40_000):
+    avih = struct.pack('<14I', usec_per_frame, 0, 0, 0, frames, 0, 1, 0, 320, 240, 0, 0, 0, 0)
+    hdrl = b'hdrl' + b'avih' + struct.pack('<I', len(avih)) + avih
+    body = b'AVI ' + b'LIST' + struct.pack('<I', len(hdrl)) + hdrl
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def asf_file(seconds, preroll_ms=3000):
+    file_properties = bytes(40) + struct.pack('<QQQ', int(seconds * 10_000_000) + preroll_ms * 10_000, 0, preroll_ms) + bytes(16)
+    stream_properties = ASF_VIDEO_MEDIA + bytes(38) + struct.pack('<II', 1280, 720) + bytes(20)
+    objects = b''.join(
+        guid + struct.pack('<Q', 24 + len(body)) + body
+        for guid, body in ((ASF_FILE_PROPERTIES, file_properties), (ASF_STREAM_PROPERTIES, stream_properties))
+    )
+    return ASF_HEADER + struct.pack('<QIH', 30 + len(objects), 2, 0) + objects
+
+
+class ProbeTests(SimpleTestCase):
+    def probe(self, data, suffix='.mp4'):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return video_probe.probe(path)
+
+    def test_mp4_with_version_0_and_1_headers(self):
+        for version in (0, 1):
+            info = self.probe(mp4_file(90_500, version=version))
+            self.assertEqual(info[:3] + info[4:], (90.5, 640, 360, 'mp4'), version)
+            self.assertGreater(info.bitrate, 0)
+
+    def test_mov(self):
+        self.assertEqual(self.probe(mp4_file(1800, timescale=600, brand=b'qt  '), '.mov')[:3], (3.0, 640, 360))
+
+    def test_fragmented_mp4_uses_fragment_duration(self):
+        self.assertEqual(self.probe(mp4_file(0, fragment_duration=12_000))[:3], (12.0, 640, 360))
+
+    def test_avi(self):
+        info = self.probe(avi_file(250), '.avi')
+        self.assertEqual((info.duration, info.width, info.height, info.container), (10.0, 320, 240, 'avi'))
+
+    def test_asf(self):
+        info = self.probe(asf_file(7.5), '.wmv')
+        self.assertEqual((info.duration, info.width, info.height, info.container), (7.5, 1280, 720, 'asf'))
+
+    def test_unusable_headers_fall_back_to_moviepy(self):
+        with mock.patch.object(video_probe, '_probe_moviepy', return_value=(5.0, 100, 50)) as moviepy:
+            for data in (
+                mp4_file(0),  # fragmented, no mehd
+                mp4_box(b'ftyp', b'isom' + bytes(4)) + mp4_box(b'mdat', bytes(10)),  # no moov
+                b'RIFF' + struct.pack('<I', 4) + b'AVI ',  # no hdrl
+                b'\x00\x00\x00\x01ftyp' + bytes(8),  # truncated 64-bit size
+            ):
+                self.assertEqual(self.probe(data), VideoInfo(5.0, 100, 50, int(len(data) * 8 / 5.0), 'other'))
+        self.assertEqual(moviepy.call_count, 4)
+
+
+class StreamingUploadValidationTests(TestCase):
+    head = b'\x00\x00\x00\x18ftypmp42'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        # Bodies over 1 KB are spooled to temporary files in temp_dir
+        self.enterContext(override_settings(
+            MEDIA_ROOT=self.media_root, FILE_UPLOAD_TEMP_DIR=self.temp_dir, FILE_UPLOAD_MAX_MEMORY_SIZE=1024,
+            UPLOAD_MAX_SIZES={'video': 200 * 1024, 'mentor_intro_video': 200 * 1024},
+        ))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, data, name='lecture.mp4'):
+        return self.client.post('/api/content/videos/', {
+            'title': 'Lecture', 'video_file': SimpleUploadedFile(name, data, content_type='video/mp4'),
+        }, format='multipart')
+
+    def assertRejected(self, response, message):
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(message, str(response.data['detail']))
+        self.assertFalse(Video.objects.exists())
+        self.assertEqual(os.listdir(self.temp_dir), [])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'blobs')))
+
+    def test_oversized_file_is_cut_off(self):
+        # Several chunks in, past the 200 KB cap
+        self.assertRejected(self.upload(self.head + bytes(300 * 1024)), 'Video file too large.')
+
+    def test_oversized_declared_length_is_not_read(self):
+        self.assertRejected(self.upload(self.head + bytes(1300 * 1024)), 'Video file too large.')
+
+    def test_wrong_content_is_rejected(self):
+        self.assertRejected(self.upload(b'<html>' + bytes(100 * 1024)), 'Unsupported video format.')
+
+    def test_file_too_short_to_identify_is_rejected(self):
+        self.assertRejected(self.upload(self.head[:8]), 'Unsupported video format.')
+
+    def test_valid_upload_is_stored(self):
+        response = self.upload(self.head + bytes(100 * 1024))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Video.objects.get().video_file.size, 100 * 1024 + len(self.head))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+
+@override_settings(THUMBNAIL_WIDTHS=(160, 320, 640))
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+    def image(self, size, mode='P'):
+        buffer = io.BytesIO()
+        Image.new(mode, size).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name='cover.png')
+
+    def assertSizes(self, sizes, expected):
+        self.assertEqual(sorted(sizes, key=int), [str(width) for width, _ in expected])
+        for width, height in expected:
+            with Image.open(os.path.join(self.media_root, sizes[str(width)])) as image:
+                self.assertEqual((image.format, image.size), (_output_format()[0], (width, height)))
+
+    def test_course_thumbnail_is_resized_to_each_width(self):
+        course = Course.objects.create(title='Course', slug='course', created_by=self.admin, thumbnail=self.image((800, 400)))
+        course_thumbnails(course.id)
+        course.refresh_from_db()
+        self.assertSizes(course.thumbnail_sizes, [(160, 80), (320, 160), (640, 320)])
+        self.assertTrue(all(path.startswith(f'thumbnails/courses/{course.id}/') for path in course.thumbnail_sizes.values()))
+
+    def test_small_source_is_not_upscaled(self):
+        course = Course.objects.create(title='Course', slug='course', created_by=self.admin, thumbnail=self.image((200, 100), 'RGB'))
+        course_thumbnails(course.id)
+        course.refresh_from_db()
+        self.assertSizes(course.thumbnail_sizes, [(160, 80), (200, 100)])
+
+    def test_video_poster_is_extracted_and_resized(self):
+        path = os.path.join(self.media_root, 'source.mp4')
+        subprocess.run(
+            [ffmpeg_path(), '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=320x180:rate=5',
+             '-t', '1', '-pix_fmt', 'yuv420p', path],
+            check=True, capture_output=True, timeout=60,
+        )
+        with open(path, 'rb') as f:
+            video = Video.objects.create(title='Video', video_file=ContentFile(f.read(), name='source.mp4'), uploaded_by=self.admin, duration=1)
+        video_thumbnails(video.id)
+        video.refresh_from_db()
+        with Image.open(video.thumbnail.path) as poster:
+            self.assertEqual((poster.format, poster.size), ('JPEG', (320, 180)))
+        self.assertSizes(video.thumbnail_sizes, [(160, 90), (320, 180)])
+
+    def test_unreadable_sources_store_nothing(self):
+        course = Course.objects.create(
+            title='Course', slug='course', created_by=self.admin, thumbnail=ContentFile(b'not an image', name='cover.png'),
+        )
+        with self.assertRaises(UnidentifiedImageError):
+            course_thumbnails(course.id)
+        course.refresh_from_db()
+        self.assertEqual(course.thumbnail_sizes, {})
+
+        video = Video.objects.create(
+            title='Video', video_file=ContentFile(b'\x00\x00\x00\x18ftypmp42' + bytes(64), name='broken.mp4'), uploaded_by=self.admin,
+        )
+        with self.assertRaises(subprocess.CalledProcessError):
+            video_thumbnails(video.id)
+        video.refresh_from_db()
+        self.assertFalse(video.thumbnail)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'thumbnails')))
+
+
+class BackfillVideoMetadataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.course = Course.objects.create(title='Course', slug='course', created_by=self.admin)
+
+    def video(self, seconds, **kwargs):
+        return Video.objects.create(
+            title='Video', video_file=ContentFile(mp4_file(seconds * 1000), name='lecture.mp4'),
+            course=self.course, uploaded_by=self.admin, **kwargs,
+        )
+
+    def backfill(self):
+        out = io.StringIO()
+        call_command('backfill_video_metadata', '--workers', '1', stdout=out)
+        return out.getvalue()
+
+    def test_missing_metadata_is_filled(self):
+        missing = [self.video(30), self.video(45)]
+        done = self.video(60, duration=61, width=1, height=1, bitrate=1)
+        self.assertIn('Updated 2 videos', self.backfill())
+
+        for video in missing:
+            video.refresh_from_db()
+            self.assertEqual((video.width, video.height), (640, 360))
+            self.assertGreater(video.bitrate, 0)
+        self.assertEqual([v.duration for v in missing], [30, 45])
+        done.refresh_from_db()
+        self.assertEqual((done.duration, done.width), (61, 1))  # already probed, left alone
+
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.video_count, self.course.total_duration), (3, 30 + 45 + 61))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIn('No videos need probing.', self.backfill())
+        self.assertEqual(len(queries), 1)
+
+
+class TranscodeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='pass', role='admin', is_active=True)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.enterContext(mock.patch.object(transcode, 'has_audio', return_value=False))
+        self.video = Video.objects.create(title='Video', video_file='blobs/aa/aa/lecture.mp4', uploaded_by=self.admin, height=360)
+        self.final_dir = transcode.hls_directory(self.video.id)
+
+    def write_playlist(self, directory, text):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'master.m3u8'), 'w') as f:
+            f.write(text)
+
+    def read_playlist(self):
+        with open(os.path.join(self.final_dir, 'master.m3u8')) as f:
+            return f.read()
+
+    def ffmpeg(self, command, **kwargs):
+        # The previous renditions are served until the new ones are complete
+        if os.path.exists(self.final_dir):
+            self.assertEqual(self.read_playlist(), 'old')
+        self.write_playlist(os.path.dirname(os.path.dirname(command[-1])), 'new')
+
+    def transcode(self, side_effect=None):
+        with mock.patch.object(transcode.subprocess, 'run', side_effect=side_effect or self.ffmpeg) as run:
+            transcode.transcode_video(self.video.id)
+        return run
+
+    def test_renditions_replace_the_previous_set(self):
+        self.write_playlist(self.final_dir, 'old')
+        self.transcode()
+        self.assertEqual(self.read_playlist(), 'new')
+        self.assertEqual(os.listdir(os.path.dirname(self.final_dir)), [str(self.video.id)])
+        self.video.refresh_from_db()
+        self.assertEqual((self.video.hls_status, self.video.hls_playlist), ('ready', f'hls/{self.video.id}/master.m3u8'))
+
+    def test_video_being_transcoded_is_skipped(self):
+        Video.objects.filter(id=self.video.id).update(hls_status='processing')
+        self.assertFalse(self.transcode().called)
+
+    def test_failure_releases_the_video(self):
+        error = subprocess.CalledProcessError(1, 'ffmpeg', stderr=b'broken')
+        with self.assertRaisesMessage(RuntimeError, 'broken'):
+            self.transcode(side_effect=error)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.hls_status, 'failed')
+        self.assertEqual(os.listdir(os.path.dirname(self.final_dir)), [])
+        self.assertTrue(self.transcode().called)  # the retry claims it again
+
+    def test_dead_transcode_is_released_when_requeued(self):
+        Video.objects.filter(id=self.video.id).update(hls_status='processing')
+        ProcessingJob.objects.create(
+            kind='video.transcode', object_id=self.video.id, status='running', locked_at=timezone.now() - timedelta(hours=1),
+        )
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.hls_status, 'pending')
+        self.assertTrue(self.transcode().called)
@@ -0,0 +1,91 @@
+"""Poster frames and resized thumbnails for courses and videos.
+
+Each thumbnail is resized to every width in THUMBNAIL_WIDTHS and stored
+next to the others under ``thumbnails/<kind>/<id>/``, as WebP when
+Pillow was built with it and JPEG otherwise. The model keeps a
+``{width: path}`` map in ``thumbnail_sizes``.
+"""
+import io
+import os
+import subprocess
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, features
+
+from .models import Course, Video
+from .transcode import ffmpeg_path
+
+
+def _output_format():
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def extract_poster(path, duration):
+    """Grab one frame, 10% into the video, as JPEG bytes."""
+    offset = duration * 0.1 if duration else 0
+    result = subprocess.run(
+        [ffmpeg_path(), '-hide_banner', '-loglevel', 'error', '-ss', f'{offset:.2f}', '-i', path,
+         '-frames:v', '1', '-f', 'image2', '-c:v', 'mjpeg', '-q:v', '3', 'pipe:1'],
+        check=True, capture_output=True, timeout=120,
+    )
+    if not result.stdout:
+        raise RuntimeError(f"ffmpeg produced no poster frame for {path}")
+    return result.stdout
+
+
+def generate_sizes(fieldfile, directory):
+    """Resize an image to each configured width and return the ``{width: path}`` map."""
+    image_format, ext = _output_format()
+    with fieldfile.open('rb') as f:
+        image = Image.open(f)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if image_format == 'JPEG':
+        image = image.convert('RGB')
+
+    _, old_files = default_storage.listdir(directory) if default_storage.exists(directory) else ([], [])
+    for name in old_files:
+        default_storage.delete(os.path.join(directory, name))
+
+    sizes = {}
+    for width in settings.THUMBNAIL_WIDTHS:
+        # Never upscale, a small source is stored once at its own width
+        width = min(width, image.width)
+        if str(width) in sizes:
+            continue
+        height = max(round(image.height * width / image.width), 1)
+        resized = image.resize((width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(buffer, image_format, quality=80)
+        sizes[str(width)] = default_storage.save(os.path.join(directory, f'{width}.{ext}'), ContentFile(buffer.getvalue()))
+    return sizes
+
+
+def video_thumbnails(video_id):
+    """Extract a poster frame if the video has no thumbnail, then resize it."""
+    video = Video.objects.filter(id=video_id).first()
+    if video is None:
+        return
+
+    fields = ['thumbnail_sizes']
+    if not video.thumbnail:
+        if not video.video_file:
+            return
+        poster = extract_poster(video.video_file.path, video.duration)
+        video.thumbnail.save(f'poster_{video.id}.jpg', ContentFile(poster), save=False)
+        fields.append('thumbnail')
+
+    video.thumbnail_sizes = generate_sizes(video.thumbnail, f'thumbnails/videos/{video.id}')
+    video.save(update_fields=fields)
+
+
+def course_thumbnails(course_id):
+    course = Course.objects.filter(id=course_id).first()
+    if course is None or not course.thumbnail:
+        return
+
+    course.thumbnail_sizes = generate_sizes(course.thumbnail, f'thumbnails/courses/{course.id}')
+    course.save(update_fields=['thumbnail_sizes'])
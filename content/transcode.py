@@ -0,0 +1,123 @@
+"""HLS transcoding of uploaded videos with the ffmpeg binary shipped with moviepy.
+
+All renditions are produced by a single ffmpeg run, so the source is
+decoded once and keyframes line up across renditions for clean bitrate
+switches. Output lives in ``MEDIA_ROOT/hls/<video id>/`` with one
+directory per rendition and a ``master.m3u8`` on top.
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Video
+
+
+def ffmpeg_path():
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    return get_ffmpeg_exe()
+
+
+def renditions_for(source_height):
+    """Ladder entries that do not upscale the source (at least the smallest one)."""
+    ladder = sorted(settings.VIDEO_HLS_RENDITIONS)
+    return [r for r in ladder if r[0] <= source_height] or ladder[:1]
+
+
+def has_audio(path):
+    result = subprocess.run([ffmpeg_path(), '-hide_banner', '-i', path], capture_output=True, text=True)
+    return re.search(r'Stream #\S+.*: Audio:', result.stderr) is not None
+
+
+def hls_directory(video_id):
+    return os.path.join(settings.MEDIA_ROOT, 'hls', str(video_id))
+
+
+def build_command(source, output_dir, renditions, audio):
+    """ffmpeg arguments writing every rendition and the master playlist into ``output_dir``."""
+    segment = settings.VIDEO_HLS_SEGMENT_SECONDS
+    count = len(renditions)
+    scales = ''.join(f'[v{i}]scale=-2:{height}[v{i}out];' for i, (height, _) in enumerate(renditions))
+    command = [
+        ffmpeg_path(), '-hide_banner', '-loglevel', 'error', '-y', '-i', source,
+        '-filter_complex', f"[0:v]split={count}{''.join(f'[v{i}]' for i in range(count))};{scales.rstrip(';')}",
+    ]
+    for i, (_, kbps) in enumerate(renditions):
+        command += [
+            '-map', f'[v{i}out]', f'-c:v:{i}', 'libx264', f'-b:v:{i}', f'{kbps}k',
+            f'-maxrate:v:{i}', f'{int(kbps * 1.07)}k', f'-bufsize:v:{i}', f'{kbps * 2}k',
+        ]
+        if audio:
+            command += ['-map', '0:a:0', f'-c:a:{i}', 'aac', f'-b:a:{i}', f'{settings.VIDEO_HLS_AUDIO_BITRATE}k', '-ac', '2']
+    streams = ' '.join(f'v:{i},a:{i}' if audio else f'v:{i}' for i in range(count))
+    command += [
+        '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        # Keyframe at every segment boundary so renditions can be switched
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment})', '-sc_threshold', '0',
+        '-f', 'hls', '-hls_time', str(segment), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%04d.ts'),
+        '-master_pl_name', 'master.m3u8',
+        '-var_stream_map', streams,
+        os.path.join(output_dir, '%v', 'index.m3u8'),
+    ]
+    return command
+
+
+def transcode_video(video_id):
+    """Produce the HLS renditions of a video and point it at the master playlist."""
+    video = Video.objects.filter(id=video_id).first()
+    if video is None or not video.video_file:
+        return
+
+    claimed = (
+        Video.objects.filter(id=video_id, video_file=video.video_file.name)
+        .exclude(hls_status='processing').update(hls_status='processing')
+    )
+    if not claimed:
+        # Another worker is transcoding this file (or it was replaced meanwhile)
+        return
+    final_dir = hls_directory(video_id)
+    # Private to this run, a job for a replaced file may still be running
+    os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f'{video_id}.partial-', dir=os.path.dirname(final_dir))
+    os.chmod(work_dir, 0o755)  # mkdtemp makes it private, the front proxy serves it
+
+    try:
+        source = video.video_file.path
+        command = build_command(source, work_dir, renditions_for(video.height), has_audio(source))
+        subprocess.run(command, check=True, capture_output=True, timeout=settings.PROCESSING_JOB_TIMEOUT)
+    except Exception as e:
+        # Released again, so a retry of this job can claim the video
+        shutil.rmtree(work_dir, ignore_errors=True)
+        Video.objects.filter(id=video_id, video_file=video.video_file.name).update(hls_status='failed')
+        if isinstance(e, (subprocess.CalledProcessError, subprocess.TimeoutExpired)):
+            stderr = getattr(e, 'stderr', b'') or b''
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace')[-2000:]}") from e
+        raise
+
+    old_dir = None
+    with transaction.atomic():
+        current = Video.objects.select_for_update().filter(id=video_id).values_list('video_file', flat=True).first()
+        if current != video.video_file.name:
+            # The file was replaced meanwhile, these renditions are of the old one
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return
+        # Swap the finished renditions in with two renames, so players never see a
+        # half-written or half-deleted set; the old one is deleted afterwards
+        if os.path.exists(final_dir):
+            old_dir = f'{work_dir}.old'
+            os.replace(final_dir, old_dir)
+        os.replace(work_dir, final_dir)
+        playlist = os.path.relpath(os.path.join(final_dir, 'master.m3u8'), settings.MEDIA_ROOT)
+        Video.objects.filter(id=video_id).update(hls_status='ready', hls_playlist=playlist.replace(os.sep, '/'))
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def remove_renditions(video_id):
+    shutil.rmtree(hls_directory(video_id), ignore_errors=True)
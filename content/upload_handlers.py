@@ -0,0 +1,81 @@
+"""Upload handler that validates video uploads while they stream in.
+
+Installed in front of Django's default handlers for the views that take
+video files. It checks the container signature in the first bytes of
+each video field (see ``content.probe.sniff_container``) and the size
+cap as chunks arrive, and stops reading the request as soon as either
+fails, instead of after a whole 150 MB body has been spooled to disk.
+
+A rejected upload leaves its reason on ``request.upload_rejection``;
+``VideoUploadValidationMixin`` turns it into a 400 response.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from rest_framework import serializers
+
+from .probe import sniff_container
+
+SNIFF_BYTES = 16
+# Room for the other form fields and multipart boundaries
+MULTIPART_OVERHEAD = 1024 * 1024
+
+
+class VideoUploadHandler(FileUploadHandler):
+    def __init__(self, request, max_sizes):
+        super().__init__(request)
+        # {field name: maximum size in bytes}
+        self.max_sizes = max_sizes
+        self.checking = False
+
+    def reject(self, message):
+        self.request.upload_rejection = message
+        # Do not read the rest of the body, the client is cut off
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        max_size = max(self.max_sizes.values(), default=0)
+        if content_length and max_size and content_length > max_size + MULTIPART_OVERHEAD:
+            # Too big as declared: report the body as parsed, without reading any of it
+            self.request.upload_rejection = f"Video file too large. Maximum size is {max_size // (1024 * 1024)}MB."
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.checking = field_name in self.max_sizes
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.checking:
+            return raw_data
+        max_size = self.max_sizes[self.field_name]
+        if start + len(raw_data) > max_size:
+            self.reject(f"Video file too large. Maximum size is {max_size // (1024 * 1024)}MB.")
+        if len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES and sniff_container(self.head) is None:
+                self.reject("Unsupported video format. Please upload MP4, MOV, AVI, or WMV.")
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.checking and len(self.head) < SNIFF_BYTES:
+            self.reject("Unsupported video format. Please upload MP4, MOV, AVI, or WMV.")
+        return None
+
+
+class VideoUploadValidationMixin:
+    """For views taking video uploads, set ``video_upload_fields = {field: UPLOAD_MAX_SIZES key}``."""
+    video_upload_fields = {}
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Handlers have to be in place before anything reads the body
+        max_sizes = {field: settings.UPLOAD_MAX_SIZES[purpose] for field, purpose in self.video_upload_fields.items()}
+        request.upload_handlers.insert(0, VideoUploadHandler(request, max_sizes))
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        rejection = getattr(self.request._request, 'upload_rejection', None)
+        if rejection:
+            raise serializers.ValidationError({'detail': rejection})
+        return super().get_serializer(*args, **kwargs)
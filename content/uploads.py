@@ -0,0 +1,218 @@
+"""Resumable uploads.
+
+A client creates an UploadSession, PUTs the file in byte ranges with a
+``Content-Range`` header, and finalizes it with the file's SHA-256. Each
+range is appended directly to a file under ``uploads/``; finalizing
+renames it to its blob name (or drops it when the blob already exists),
+and the finished upload is attached to a Video or mentor by assigning
+that name, without copying it again. An interrupted client asks for the
+session and resumes from ``offset``.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from backend.storage import blob_storage
+
+from .models import MediaBlob, UploadSession
+from .probe import sniff_container
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.wmv')
+READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """The range does not start where the upload stands, the client should resume from ``offset``."""
+
+    def __init__(self, offset):
+        super().__init__(f'Expected a range starting at {offset}.')
+        self.offset = offset
+
+
+def max_upload_size(purpose):
+    return settings.UPLOAD_MAX_SIZES[purpose]
+
+
+def storage_name(filename):
+    """Where the chunks go until the upload is finalized."""
+    return f'uploads/{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}'
+
+
+def create_session(purpose, filename, size, user=None, sha256=''):
+    filename = get_valid_filename(os.path.basename(filename or ''))
+    if not filename.lower().endswith(VIDEO_EXTENSIONS):
+        raise UploadError('Unsupported video format. Please upload MP4, MOV, AVI, or WMV.')
+    if size <= 0:
+        raise UploadError('Size must be positive.')
+    if size > max_upload_size(purpose):
+        raise UploadError(f'File too large. Maximum size is {max_upload_size(purpose) // (1024 * 1024)}MB.')
+
+    # Reserve the final name with an empty file, chunks are written into it
+    name = storage_name(filename)
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'xb').close()
+    return UploadSession.objects.create(
+        purpose=purpose, created_by=user, filename=filename, path=name, size=size, sha256=(sha256 or '').lower(),
+    )
+
+
+def parse_content_range(header, size):
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Content-Range header "bytes <start>-<end>/<size>" is required.')
+    start, end, total = map(int, match.groups())
+    if total != size or end < start or end >= size:
+        raise UploadError('Content-Range does not match the upload.')
+    if end - start + 1 > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadError(f'Chunks may not exceed {settings.UPLOAD_CHUNK_MAX_SIZE} bytes.')
+    return start, end
+
+
+def _check_range(session, content_range):
+    if session.status != 'uploading':
+        raise UploadError(f'Upload is {session.status}.')
+    start, end = parse_content_range(content_range, session.size)
+    if start != session.received:
+        raise OffsetMismatch(session.received)
+    return start, end
+
+
+def _read_range(stream, length):
+    """Read up to ``length`` bytes of the body into a temporary file, returning it and the bytes read."""
+    buffer = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    remaining = length
+    while remaining:
+        data = stream.read(min(READ_SIZE, remaining))
+        if not data:
+            break
+        buffer.write(data)
+        remaining -= len(data)
+    buffer.seek(0)
+    return buffer, length - remaining
+
+
+def write_chunk(session_id, content_range, stream):
+    """Append one range read from ``stream`` and return the session.
+
+    Ranges must start at the current offset. A connection that drops
+    mid-chunk keeps the bytes that arrived, and the client resumes from
+    the offset it is given back. The body is read before the session row
+    is locked, so a slow client holds no lock or transaction; the offset
+    is checked again under the lock.
+    """
+    start, end = _check_range(UploadSession.objects.get(id=session_id), content_range)
+    buffer, received = _read_range(stream, end - start + 1)
+    with buffer:
+        if start == 0 and received and sniff_container(buffer.read(16)) is None:
+            # Same signature check as the multipart upload handler
+            raise UploadError('Unsupported video format. Please upload MP4, MOV, AVI, or WMV.')
+        buffer.seek(0)
+
+        with transaction.atomic():
+            # Serializes concurrent PUTs for the same session
+            session = UploadSession.objects.select_for_update().get(id=session_id)
+            _check_range(session, content_range)
+            with open(default_storage.path(session.path), 'r+b') as f:
+                f.seek(start)
+                shutil.copyfileobj(buffer, f, READ_SIZE)
+                f.truncate()
+            session.received = start + received
+            session.save(update_fields=['received', 'updated_at'])
+    return session
+
+
+def file_sha256(name):
+    digest = hashlib.sha256()
+    with open(default_storage.path(name), 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finalize_session(session_id, sha256=''):
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session_id)
+        if session.status == 'complete':
+            return session
+        if session.status != 'uploading':
+            raise UploadError(f'Upload is {session.status}.')
+        if session.received != session.size:
+            raise UploadError(f'Upload is incomplete, {session.received} of {session.size} bytes received.')
+        expected = (sha256 or session.sha256).lower()
+        if not expected:
+            raise UploadError('sha256 of the file is required.')
+
+        actual = file_sha256(session.path)
+        session.sha256 = actual
+        if actual != expected:
+            # The bytes on disk are unusable, the client has to start over
+            session.status = 'failed'
+            session.save(update_fields=['sha256', 'status', 'updated_at'])
+            default_storage.delete(session.path)
+        else:
+            session.path = blob_storage.adopt(session.path, actual)
+            session.status = 'complete'
+            session.save(update_fields=['sha256', 'path', 'status', 'updated_at'])
+    if session.status == 'failed':
+        raise UploadError('Checksum mismatch, the upload has to be restarted.')
+    return session
+
+
+def claim_upload(upload_id, purpose, user=None):
+    """Mark a complete upload as attached and return its storage name.
+
+    Must run inside the transaction that saves the object the file is
+    attached to, so a failed save leaves the upload claimable.
+    """
+    try:
+        session = UploadSession.objects.select_for_update().get(id=upload_id, purpose=purpose)
+    except UploadSession.DoesNotExist:
+        raise UploadError('Unknown upload.')
+    if session.created_by_id is not None and (user is None or session.created_by_id != user.id):
+        raise UploadError('Unknown upload.')
+    if session.status != 'complete':
+        raise UploadError('Upload is not finalized.' if session.status == 'uploading' else f'Upload is {session.status}.')
+    session.status = 'attached'
+    session.save(update_fields=['status', 'updated_at'])
+    return session.path
+
+
+def _blob_in_use(name):
+    """Whether a finalized upload's blob is referenced by rows or by other unclaimed uploads."""
+    return (
+        MediaBlob.objects.filter(name=name).exists()
+        or UploadSession.objects.filter(path=name, status='complete').exists()
+    )
+
+
+def purge_stale_sessions(max_age=None):
+    """Delete sessions that were never attached, with their partial files."""
+    max_age = settings.UPLOAD_SESSION_TTL if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = UploadSession.objects.filter(updated_at__lt=cutoff).exclude(status='attached')
+    count = 0
+    for session in stale.iterator():
+        with transaction.atomic():
+            session.delete()
+            # Identical uploads share one content-addressed blob; a blob with a
+            # MediaBlob row is left to content.blobs to collect
+            if session.status == 'uploading' or (session.status == 'complete' and not _blob_in_use(session.path)):
+                transaction.on_commit(lambda name=session.path: default_storage.delete(name))
+        count += 1
+    return count
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import VideoViewSet, CourseViewSet
+from .views import VideoViewSet, CourseViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'courses', CourseViewSet)
 router.register(r'videos', VideoViewSet)
+router.register(r'uploads', UploadSessionViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,11 +1,18 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import Video, Course
+from backend.media import IgnoreClientContentNegotiation, ranged_file_response
+from backend.pagination import CourseOrderCursorPagination
+from backend.throttling import IPTokenBucketThrottle
+from .models import Video, Course, UploadSession
+from .upload_handlers import VideoUploadValidationMixin
+from .uploads import OffsetMismatch, UploadError, create_session, finalize_session, write_chunk
 from .serializers import (
     VideoSerializer, VideoUploadSerializer,
-    CourseListSerializer, CourseDetailSerializer, CourseCreateUpdateSerializer
+    CourseListSerializer, CourseDetailSerializer, CourseCreateUpdateSerializer,
+    UploadSessionSerializer, UploadSessionCreateSerializer
 )
 
 
@@ -25,6 +32,11 @@ class CourseViewSet(viewsets.ModelViewSet):
     queryset = Course.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
     
+    def get_queryset(self):
+        # Video totals are stored on the course, so joining the creator is
+        # all that is needed to serve the catalog in one query.
+        return Course.objects.select_related('created_by')
+    
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return CourseDetailSerializer
@@ -53,14 +65,17 @@ class CourseViewSet(viewsets.ModelViewSet):
     def videos(self, request, pk=None):
         """Get all videos for a specific course."""
         course = self.get_object()
-        videos = course.videos.filter(is_active=True).order_by('order_in_course')
-        serializer = VideoSerializer(videos, many=True, context={'request': request})
-        return Response(serializer.data)
+        videos = course.videos.filter(is_active=True).select_related('uploaded_by', 'course')
+        paginator = CourseOrderCursorPagination()
+        page = paginator.paginate_queryset(videos, request, view=self)
+        serializer = VideoSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
 
-class VideoViewSet(viewsets.ModelViewSet):
-    queryset = Video.objects.filter(is_active=True)
+class VideoViewSet(VideoUploadValidationMixin, viewsets.ModelViewSet):
+    queryset = Video.objects.filter(is_active=True).select_related('uploaded_by', 'course')
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
+    video_upload_fields = {'video_file': 'video'}
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -78,9 +93,10 @@ class VideoViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def my_videos(self, request):
         """Get videos uploaded by the current user."""
-        videos = Video.objects.filter(uploaded_by=request.user)
-        serializer = VideoSerializer(videos, many=True, context={'request': request})
-        return Response(serializer.data)
+        videos = Video.objects.filter(uploaded_by=request.user).select_related('uploaded_by', 'course')
+        page = self.paginate_queryset(videos)
+        serializer = VideoSerializer(page, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
@@ -91,6 +107,14 @@ class VideoViewSet(viewsets.ModelViewSet):
         serializer = VideoSerializer(video, context={'request': request})
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'], content_negotiation_class=IgnoreClientContentNegotiation)
+    def stream(self, request, pk=None):
+        """Stream the video file, supporting Range requests for seeking."""
+        video = self.get_object()
+        if not video.video_file:
+            raise Http404("Video has no file.")
+        return ranged_file_response(request, video.video_file.path)
+    
     @action(detail=False, methods=['get'])
     def by_course(self, request):
         """Get videos filtered by course."""
@@ -99,6 +123,83 @@ class VideoViewSet(viewsets.ModelViewSet):
             return Response({"error": "course_id parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
         
         course = get_object_or_404(Course, id=course_id)
-        videos = Video.objects.filter(course=course, is_active=True).order_by('order_in_course')
-        serializer = VideoSerializer(videos, many=True, context={'request': request})
-        return Response(serializer.data)
+        videos = Video.objects.filter(course=course, is_active=True).select_related('uploaded_by', 'course')
+        paginator = CourseOrderCursorPagination()
+        page = paginator.paginate_queryset(videos, request, view=self)
+        serializer = VideoSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """Resumable uploads: create a session, PUT byte ranges, then finalize.
+
+    Course video uploads need an admin; mentor intro videos can be
+    uploaded before registering, the session id is then the credential.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.AllowAny]
+    throttle_scope = 'upload'
+
+    def get_throttles(self):
+        # Only opening sessions is limited, the chunks of one upload are not
+        if self.action == 'create':
+            return [IPTokenBucketThrottle()]
+        return []
+
+    def get_object(self):
+        session = super().get_object()
+        if session.created_by_id is not None and session.created_by_id != self.request.user.id:
+            raise Http404
+        return session
+
+    def session_response(self, session, status_code=status.HTTP_200_OK):
+        response = Response(UploadSessionSerializer(session).data, status=status_code)
+        response['Upload-Offset'] = session.received
+        return response
+
+    def create(self, request):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        purpose = serializer.validated_data['purpose']
+        user = request.user if request.user.is_authenticated else None
+        if purpose == 'video' and (user is None or user.role != 'admin'):
+            return Response({'error': 'Only admin users can upload videos.'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            session = create_session(
+                purpose, serializer.validated_data['filename'], serializer.validated_data['size'],
+                user=user, sha256=serializer.validated_data.get('sha256', ''),
+            )
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.session_response(session, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        """Current offset, to resume an interrupted upload."""
+        return self.session_response(self.get_object())
+
+    def update(self, request, pk=None):
+        """Write one byte range, the body is the raw bytes."""
+        session = self.get_object()
+        if request.stream is None:
+            return Response({'error': 'Empty chunk.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session = write_chunk(session.id, request.META.get('HTTP_CONTENT_RANGE'), request.stream)
+        except OffsetMismatch as e:
+            response = Response({'error': str(e), 'offset': e.offset}, status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = e.offset
+            return response
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.session_response(session)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Check the SHA-256 of the whole file, after which it can be attached."""
+        session = self.get_object()
+        try:
+            session = finalize_session(session.id, request.data.get('sha256', ''))
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.session_response(session)
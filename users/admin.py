@@ -3,8 +3,11 @@
 # admin.py
 from django.contrib import admin
 from .models import User, Pairing
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from .models import Pairing, User
+from .models import Pairing, User, OutboundEmail, RevokedToken
+from .mail import purge_sent
+from .revocation import purge_expired
 
 class MentorFullNameFilter(admin.SimpleListFilter):
     title = _('Mentor')
@@ -43,3 +46,35 @@ class PairingAdmin(admin.ModelAdmin):
     search_fields = ('mentor__email', 'student__email','mentor__first_name', 'student__first_name', 'mentor__last_name', 'student__last_name')
     list_filter = (MentorFullNameFilter, StudentFullNameFilter)
 
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email', 'subject')
+    # Bodies may hold one-time codes and temporary passwords
+    exclude = ('body',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ['retry_emails', 'purge_sent_emails']
+
+    @admin.action(description='Retry selected emails')
+    def retry_emails(self, request, queryset):
+        updated = queryset.filter(status='failed').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} emails queued for retry.")
+
+    @admin.action(description='Purge emails sent before the retention period')
+    def purge_sent_emails(self, request, queryset):
+        self.message_user(request, f"{purge_sent()} sent emails deleted.")
+
+
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ('jti', 'user', 'revoked_at', 'expires_at')
+    search_fields = ('jti', 'user__email')
+    raw_id_fields = ('user',)
+    readonly_fields = ('revoked_at',)
+    actions = ['purge_expired_tokens']
+
+    @admin.action(description='Purge revocations of expired tokens')
+    def purge_expired_tokens(self, request, queryset):
+        self.message_user(request, f"{purge_expired()} expired revocations deleted.")
@@ -0,0 +1,103 @@
+"""JWT authentication that keeps recently seen users in memory.
+
+Access tokens live for weeks, so the same few users are loaded on every
+request. ``CachedJWTAuthentication`` keeps a snapshot of each user for
+AUTH_USER_CACHE_TTL seconds in a bounded LRU map. Saving or deleting a
+user drops the entry in this process (see the receivers in
+``users.models``); other worker processes pick the change up when their
+entry expires, as do ``QuerySet.update()`` calls, which send no signals.
+
+Tokens are also checked against the revocation list (``users.revocation``).
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """Thread-safe LRU map with a per-entry time to live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation, so a lookup that raced with a save
+        # does not put the old row back
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return user
+
+    def set(self, key, user, generation):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, user)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self.generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that only hits the database on a cache miss."""
+
+    def get_validated_token(self, raw_token):
+        from .revocation import revocation_list
+
+        validated_token = super().get_validated_token(raw_token)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti is not None and revocation_list.is_revoked(jti):
+            raise InvalidToken(_("Token has been revoked"))
+        return validated_token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        user = user_cache.get(str(user_id))
+        if user is None:
+            generation = user_cache.generation
+            # Raises for unknown and inactive users, so those are never cached
+            user = super().get_user(validated_token)
+            user_cache.set(str(user_id), user, generation)
+        elif api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # Each request gets its own copy, changes made by a view stay local
+        return copy.copy(user)
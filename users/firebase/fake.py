@@ -0,0 +1,157 @@
+"""In-memory stand-in for the parts of the Firestore client the app uses.
+
+Documents live in a dict keyed by their path. Batches are applied
+atomically and, like Firestore, refuse more than 500 writes.
+"""
+import base64
+import copy
+import json
+import random
+import string
+import threading
+import time
+from datetime import datetime, timezone
+
+MAX_BATCH_WRITES = 500
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+def _auto_id():
+    return ''.join(random.choices(_ID_CHARS, k=20))
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self._client, f'{self.path}/{collection_id}')
+
+    def get(self):
+        return FakeDocumentSnapshot(self, self._client._read(self.path))
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self, document_data, merge)])[0]
+
+    def update(self, field_updates):
+        return self._client._commit([('update', self, field_updates, True)])[0]
+
+    def delete(self):
+        return self._client._commit([('delete', self, None, False)])[0]
+
+
+class FakeCollectionReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._client, f'{self.path}/{document_id or _auto_id()}')
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        return reference.set(document_data), reference
+
+    def stream(self):
+        prefix = self.path + '/'
+        for path, data in self._client._children(prefix):
+            yield FakeDocumentSnapshot(FakeDocumentReference(self._client, path), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+        return self
+
+    def update(self, reference, field_updates):
+        self._writes.append(('update', reference, field_updates, True))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+        return self
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        return self._client._commit(writes)
+
+
+class FakeFirestore:
+    def __init__(self, latency=0):
+        # Seconds each commit takes, to stand in for the network round trip
+        self.latency = latency
+        self._docs = {}
+        self._lock = threading.Lock()
+        self.commits = 0
+
+    def collection(self, collection_id):
+        return FakeCollectionReference(self, collection_id)
+
+    def document(self, document_path):
+        return FakeDocumentReference(self, document_path)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def _read(self, path):
+        with self._lock:
+            return copy.deepcopy(self._docs.get(path))
+
+    def _children(self, prefix):
+        with self._lock:
+            items = [(p, copy.deepcopy(d)) for p, d in self._docs.items()
+                     if p.startswith(prefix) and '/' not in p[len(prefix):]]
+        return items
+
+    def _commit(self, writes):
+        if len(writes) > MAX_BATCH_WRITES:
+            raise ValueError(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for op, reference, data, merge in writes:
+                if op == 'update' and reference.path not in self._docs:
+                    raise KeyError(f"No document to update: {reference.path}")
+            now = datetime.now(timezone.utc)
+            for op, reference, data, merge in writes:
+                if op == 'delete':
+                    self._docs.pop(reference.path, None)
+                elif merge:
+                    self._docs.setdefault(reference.path, {}).update(copy.deepcopy(data))
+                else:
+                    self._docs[reference.path] = copy.deepcopy(data)
+            self.commits += 1
+        return [now] * len(writes)
+
+
+def fake_custom_token(uid, claims=None):
+    """Unsigned token with the same shape as a real one, for tests."""
+    payload = json.dumps({'uid': uid, 'claims': claims or {}}, sort_keys=True, default=str).encode()
+    return b'fake.' + base64.urlsafe_b64encode(payload).rstrip(b'=') + b'.unsigned'
@@ -1,26 +1,142 @@
 # myproject/firebase/firebase.py
+"""Firebase app and Firestore client, created on first use.
+
+Nothing here talks to Firebase at import time, so manage.py commands,
+migrations and tests start without credentials. Each process gets its
+own app and client: a gRPC channel inherited across ``fork()`` (gunicorn
+with ``--preload``, the backfill command's process pool) is not usable,
+so a child drops what it inherited and builds its own on first use.
+
+With FIREBASE_USE_FAKE the in-memory stand-in from ``fake.py`` is used
+instead, for tests and local development.
+
+Custom tokens are RSA-signed, so ``cached_custom_token`` keeps one per
+user in the cache for most of its one hour lifetime.
+"""
+import hashlib
+import json
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import threading
+
 from decouple import config
+from django.conf import settings
+from django.core.cache import caches
+
+# Firebase rejects custom tokens older than this at sign-in
+CUSTOM_TOKEN_LIFETIME = 3600
+
+_lock = threading.Lock()
+_pid = None
+_app = None
+_db = None
+
+
+def _reset():
+    global _pid, _app, _db
+    # The parent's objects are left alone, closing inherited channels could disturb it
+    _pid, _app, _db = None, None, None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _credentials():
+    return {
+        "type": config("FIREBASE_TYPE"),
+        "project_id": config("FIREBASE_PROJECT_ID"),
+        "private_key_id": config("FIREBASE_PRIVATE_KEY_ID"),
+        "private_key": config("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
+        "client_email": config("FIREBASE_CLIENT_EMAIL"),
+        "client_id": config("FIREBASE_CLIENT_ID"),
+        "auth_uri": config("FIREBASE_AUTH_URI"),
+        "token_uri": config("FIREBASE_TOKEN_URI"),
+        "auth_provider_x509_cert_url": config("FIREBASE_AUTH_PROVIDER_CERT_URL"),
+        "client_x509_cert_url": config("FIREBASE_CLIENT_CERT_URL"),
+    }
+
+
+def _current_process():
+    """Forget objects created by another process (fork without register_at_fork)."""
+    if _pid != os.getpid():
+        _reset()
+
+
+def get_app():
+    global _pid, _app
+    if _app is not None and _pid == os.getpid():
+        return _app
+    with _lock:
+        _current_process()
+        if _app is None:
+            import firebase_admin
+            from firebase_admin import credentials
+
+            # Named per process, the default app of a forked parent stays registered
+            _app = firebase_admin.initialize_app(credentials.Certificate(_credentials()), name=f'gmsp-{os.getpid()}')
+            _pid = os.getpid()
+        return _app
+
+
+def get_db():
+    """Firestore client of this process."""
+    global _pid, _db
+    if _db is not None and _pid == os.getpid():
+        return _db
+    if settings.FIREBASE_USE_FAKE:
+        with _lock:
+            _current_process()
+            if _db is None:
+                from .fake import FakeFirestore
+
+                _db, _pid = FakeFirestore(), os.getpid()
+            return _db
+
+    app = get_app()
+    with _lock:
+        if _db is None:
+            from firebase_admin import firestore
+
+            _db = firestore.client(app)
+        return _db
+
+
+def create_custom_token(uid, claims=None):
+    """Firebase custom auth token (bytes) for ``uid``."""
+    if settings.FIREBASE_USE_FAKE:
+        from .fake import fake_custom_token
+
+        return fake_custom_token(uid, claims)
+    from firebase_admin import auth
+
+    return auth.create_custom_token(uid, claims, app=get_app())
+
+
+def firebase_uid(user):
+    # Firebase UIDs are strings and must be unique
+    return f"user_{user.id}"
+
+
+def _token_key(uid):
+    return f'firebase-token:{uid}'
 
-firebase_config = {
-    "type": config("FIREBASE_TYPE"),
-    "project_id": config("FIREBASE_PROJECT_ID"),
-    "private_key_id": config("FIREBASE_PRIVATE_KEY_ID"),
-    "private_key": config("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
-    "client_email": config("FIREBASE_CLIENT_EMAIL"),
-    "client_id": config("FIREBASE_CLIENT_ID"),
-    "auth_uri": config("FIREBASE_AUTH_URI"),
-    "token_uri": config("FIREBASE_TOKEN_URI"),
-    "auth_provider_x509_cert_url": config("FIREBASE_AUTH_PROVIDER_CERT_URL"),
-    "client_x509_cert_url": config("FIREBASE_CLIENT_CERT_URL"),
-}
 
-cred = credentials.Certificate(firebase_config)
-firebase_admin.initialize_app(cred)
+def cached_custom_token(uid, claims=None):
+    """``create_custom_token`` reused until FIREBASE_TOKEN_REFRESH_MARGIN seconds before it expires.
 
-db = firestore.client()
+    The entry is per uid and remembers a hash of the claims it was signed
+    with, so a token with outdated claims is never handed out.
+    """
+    cache = caches[settings.FIREBASE_TOKEN_CACHE_ALIAS]
+    claims_hash = hashlib.sha256(json.dumps(claims or {}, sort_keys=True, default=str).encode()).hexdigest()
+    cached = cache.get(_token_key(uid))
+    if cached is not None and cached[0] == claims_hash:
+        return cached[1]
 
+    token = create_custom_token(uid, claims)
+    cache.set(_token_key(uid), (claims_hash, token), timeout=CUSTOM_TOKEN_LIFETIME - settings.FIREBASE_TOKEN_REFRESH_MARGIN)
+    return token
 
 
+def invalidate_custom_token(uid):
+    caches[settings.FIREBASE_TOKEN_CACHE_ALIAS].delete(_token_key(uid))
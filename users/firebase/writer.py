@@ -0,0 +1,151 @@
+"""Buffered, batched Firestore writes.
+
+``submit()`` queues a document write and returns its id straight away;
+a background thread of the process commits queued writes as Firestore
+``WriteBatch`` es of up to FIRESTORE_WRITER_BATCH_SIZE writes, after
+waiting at most FIRESTORE_WRITER_FLUSH_INTERVAL seconds for a batch to
+fill. Document ids are generated here, so a batch that failed can be
+committed again without creating duplicates.
+
+Writes still queued when the process is killed are lost; ``flush()``
+runs at interpreter exit for a normal shutdown.
+"""
+import atexit
+import logging
+import os
+import secrets
+import string
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+
+from .firebase import get_db
+
+logger = logging.getLogger(__name__)
+
+Write = namedtuple('Write', ['collection', 'document_id', 'data'])
+
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+class WriterOverloaded(Exception):
+    pass
+
+
+def new_document_id():
+    """20 random characters, like Firestore's own auto ids."""
+    return ''.join(secrets.choice(_ID_CHARS) for _ in range(20))
+
+
+class FirestoreWriter:
+    def __init__(self, client=get_db, batch_size=None, flush_interval=None, max_retries=None, max_pending=None):
+        self.client = client
+        self.batch_size = batch_size or settings.FIRESTORE_WRITER_BATCH_SIZE
+        self.flush_interval = settings.FIRESTORE_WRITER_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_retries = settings.FIRESTORE_WRITER_MAX_RETRIES if max_retries is None else max_retries
+        self.max_pending = max_pending or settings.FIRESTORE_WRITER_MAX_PENDING
+        self.commit_hooks = []
+        self.committed = self.failed = self.batches = 0
+        self._reset()
+
+    def _reset(self):
+        # Also run in a forked child: it gets neither the thread nor a usable lock,
+        # and the writes it inherited are committed by the parent
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._submitted = self._done = 0
+        self._thread = None
+
+    def on_commit(self, hook):
+        """Call ``hook(writes)`` in the writer thread after each successful batch."""
+        self.commit_hooks.append(hook)
+        return hook
+
+    def submit(self, collection, data, document_id=None):
+        """Queue a write of ``data`` to ``collection`` and return the document id."""
+        document_id = document_id or new_document_id()
+        with self._cond:
+            self._ensure_thread()
+            if len(self._pending) >= self.max_pending:
+                raise WriterOverloaded(f"{len(self._pending)} Firestore writes already queued")
+            self._pending.append(Write(collection, document_id, data))
+            self._submitted += 1
+            self._cond.notify_all()
+        return document_id
+
+    def flush(self, timeout=None):
+        """Wait until everything submitted so far was committed or given up on."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._submitted
+            while self._done < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='firestore-writer', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Give concurrent requests a moment to join this batch
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._pending), self.batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _commit(self, writes):
+        db = self.client()
+        batch = db.batch()
+        for write in writes:
+            batch.set(db.collection(write.collection).document(write.document_id), write.data)
+        batch.commit()
+
+    def _run(self):
+        while True:
+            writes = self._next_batch()
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._commit(writes)
+                except Exception:
+                    if attempt == self.max_retries:
+                        logger.exception(f"Dropping {len(writes)} Firestore writes after {attempt + 1} attempts")
+                        self.failed += len(writes)
+                    else:
+                        time.sleep(min(0.05 * 2 ** attempt, 5))
+                    continue
+                self.committed += len(writes)
+                self.batches += 1
+                for hook in self.commit_hooks:
+                    try:
+                        hook(writes)
+                    except Exception:
+                        logger.exception(f"Firestore commit hook {hook!r} failed")
+                break
+            with self._cond:
+                self._done += len(writes)
+                self._cond.notify_all()
+
+
+writer = FirestoreWriter()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=writer._reset)
+
+
+@atexit.register
+def _flush_at_exit():
+    if writer._thread is not None:
+        writer.flush(timeout=10)
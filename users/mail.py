@@ -0,0 +1,136 @@
+"""Transactional email outbox.
+
+Views queue mail with ``queue_mail`` inside their own transaction, so
+the email exists exactly when the change that triggered it commits.
+The ``send_outbox`` command drains the outbox in batches over a single
+connection from ``get_connection()``; with the locmem or console
+backends configured through EMAIL_BACKEND nothing leaves the machine.
+Bodies carry one-time codes and temporary passwords, so a row's body is
+blanked as soon as it has been sent.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """Same arguments as ``send_mail``, but only writes outbox rows."""
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(to_email=recipient, subject=subject, body=message, from_email=from_email or '')
+        for recipient in recipient_list
+    ])
+
+
+def queue_mass_mail(datatuple):
+    """Same arguments as ``send_mass_mail``: (subject, message, from_email, recipient_list) tuples."""
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(to_email=recipient, subject=subject, body=message, from_email=from_email or '')
+        for subject, message, from_email, recipient_list in datatuple
+        for recipient in recipient_list
+    ])
+
+
+def claim_batch(batch_size):
+    """Mark up to ``batch_size`` due emails as sending and return them."""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        # next_attempt_at doubles as the claim time while sending
+        OutboundEmail.objects.filter(id__in=[e.id for e in emails]).update(status='sending', next_attempt_at=now)
+    for email in emails:
+        email.next_attempt_at = now
+    return emails
+
+
+def requeue_stale(minutes=10):
+    """Return emails stuck in 'sending' by a dispatcher that died back to the queue."""
+    cutoff = timezone.now() - timedelta(minutes=minutes)
+    return OutboundEmail.objects.filter(status='sending', next_attempt_at__lt=cutoff).update(status='pending')
+
+
+def purge_sent(max_age=None):
+    """Delete emails sent more than ``max_age`` seconds ago (default EMAIL_OUTBOX_RETENTION), returning how many."""
+    max_age = settings.EMAIL_OUTBOX_RETENTION if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    deleted, _ = OutboundEmail.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def _defer(emails, error):
+    """Put emails back in the queue without using up an attempt, the server was unreachable."""
+    retry_at = timezone.now() + timedelta(seconds=settings.EMAIL_OUTBOX_BACKOFF)
+    for email in emails:
+        email.status = 'pending'
+        email.next_attempt_at = retry_at
+        email.last_error = error
+
+
+def dispatch_outbox(batch_size=100, connection=None):
+    """Send one batch of due emails over a single connection, returning (sent, failed).
+
+    After a failed message the connection is closed, since the session may
+    be broken, and opened again for the next one. When it cannot be opened
+    (server down, bad credentials) the unsent rest of the batch is deferred
+    by EMAIL_OUTBOX_BACKOFF seconds and counted as failed.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    connection = connection or get_connection()
+    sent = failed = 0
+    now = timezone.now()
+    try:
+        for i, email in enumerate(emails):
+            try:
+                connection.open()  # no-op while the connection is up
+            except Exception as e:
+                logger.warning(f"Cannot connect to the mail server, deferring {len(emails) - i} emails: {e}")
+                _defer(emails[i:], str(e))
+                failed += len(emails) - i
+                break
+
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email or None,
+                to=[email.to_email],
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                logger.warning(f"Failed to send email {email.id} to {email.to_email}: {e}")
+                failed += 1
+                email.last_error = str(e)
+                if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    email.status = 'failed'
+                else:
+                    email.status = 'pending'
+                    email.next_attempt_at = now + timedelta(seconds=settings.EMAIL_OUTBOX_BACKOFF * 2 ** (email.attempts - 1))
+                connection.close()
+            else:
+                sent += 1
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                email.body = ''
+    finally:
+        try:
+            connection.close()
+        finally:
+            OutboundEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'body'])
+    return sent, failed
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.firebase.fake import FakeFirestore
+from users.firebase.writer import FirestoreWriter
+
+
+class Command(BaseCommand):
+    help = 'Compare one Firestore round trip per chat message with the batched writer, against the in-memory fake.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--senders', type=int, default=8, help='Concurrent threads sending messages.')
+        parser.add_argument('--latency', type=float, default=20, help='Simulated Firestore round trip in milliseconds.')
+
+    def run(self, send, options):
+        per_sender = options['messages'] // options['senders']
+        timings = []
+
+        def sender(number):
+            for i in range(per_sender):
+                started = time.perf_counter()
+                send(f'chats/bench-{number % 4}/messages', {'text': f'message {i}', 'senderId': number})
+                timings.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=sender, args=(n,)) for n in range(options['senders'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, started
+
+    def report(self, label, timings, elapsed, db):
+        timings.sort()
+        self.stdout.write(
+            f"{label:<8} {len(timings) / elapsed:8.0f} msg/s, request p50 {timings[len(timings) // 2] * 1000:7.2f} ms, "
+            f"p99 {timings[int(len(timings) * 0.99)] * 1000:7.2f} ms, {db.commits} commits"
+        )
+
+    def handle(self, *args, **options):
+        latency = options['latency'] / 1000
+
+        db = FakeFirestore(latency=latency)
+        timings, started = self.run(lambda collection, data: db.collection(collection).add(data), options)
+        self.report('direct', timings, time.perf_counter() - started, db)
+
+        db = FakeFirestore(latency=latency)
+        writer = FirestoreWriter(client=lambda: db)
+        timings, started = self.run(writer.submit, options)
+        writer.flush()
+        self.report('batched', timings, time.perf_counter() - started, db)
@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from users.models import User
+from users.views import LoginView
+
+PASSWORD = 'Benchmark-Passw0rd!'
+
+
+class Command(BaseCommand):
+    help = 'Measure login latency (p50/p99) and queries per login for each role. Nothing is kept in the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Logins measured per role.')
+        parser.add_argument('--roles', nargs='+', default=['student', 'mentor', 'admin'])
+
+    def percentile(self, values, pct):
+        ordered = sorted(values)
+        return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        # Measure the login itself, the buckets would reject all but the first logins
+        original = LoginView.throttle_classes
+        LoginView.throttle_classes = []
+        view = LoginView.as_view()
+
+        try:
+            self.measure(factory, view, options)
+        finally:
+            LoginView.throttle_classes = original
+
+    def measure(self, factory, view, options):
+        with transaction.atomic():
+            for role in options['roles']:
+                user = User.objects.create_user(
+                    email=f'benchmark-login-{role}@example.com', password=PASSWORD,
+                    first_name='Benchmark', last_name=role.title(), role=role, is_active=True,
+                )
+                timings, queries, writes = [], [], []
+                for _ in range(options['iterations']):
+                    request = factory.post('/api/users/login/', {'email': user.email, 'password': PASSWORD}, format='json')
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        response = view(request)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200:
+                        self.stdout.write(self.style.ERROR(f"{role}: login failed with {response.status_code}: {response.data}"))
+                        break
+                    queries.append(len(ctx.captured_queries))
+                    writes.append(sum(1 for q in ctx.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT')))
+
+                if timings and len(timings) == len(queries):
+                    self.stdout.write(
+                        f"{role:<8} p50 {statistics.median(timings):7.1f} ms  p99 {self.percentile(timings, 99):7.1f} ms  "
+                        f"queries/login {statistics.mean(queries):.2f} (max {max(queries)})  "
+                        f"writes/login {statistics.mean(writes):.2f} (max {max(writes)})"
+                    )
+
+            # Drop the benchmark users again
+            transaction.set_rollback(True)
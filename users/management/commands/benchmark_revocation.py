@@ -0,0 +1,66 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.models import RevokedToken
+from users.revocation import RevocationList
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of the JWT revocation check, filter versus a plain table lookup. Nothing is kept in the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revoked', type=int, default=10000, help='Revoked tokens in the table.')
+        parser.add_argument('--checks', type=int, default=5000, help='Lookups of tokens that were never revoked.')
+
+    def handle(self, *args, **options):
+        expires_at = timezone.now() + timedelta(days=30)
+        fresh = [uuid.uuid4().hex for _ in range(options['checks'])]
+
+        with transaction.atomic():
+            RevokedToken.objects.bulk_create(
+                [RevokedToken(jti=uuid.uuid4().hex, expires_at=expires_at) for _ in range(options['revoked'])],
+                batch_size=1000,
+            )
+            revoked_sample = list(RevokedToken.objects.values_list('jti', flat=True)[:100])
+
+            started = time.perf_counter()
+            revocations = RevocationList(refresh_interval=3600)
+            revocations.refresh(force=True)
+            build_ms = (time.perf_counter() - started) * 1000
+
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                for jti in fresh:
+                    revocations.is_revoked(jti)
+                filter_us = (time.perf_counter() - started) / len(fresh) * 1e6
+            false_positives = len(ctx.captured_queries)
+
+            started = time.perf_counter()
+            for jti in fresh:
+                RevokedToken.objects.filter(jti=jti).exists()
+            table_us = (time.perf_counter() - started) / len(fresh) * 1e6
+
+            missed = sum(1 for jti in revoked_sample if not revocations.is_revoked(jti))
+
+            transaction.set_rollback(True)
+
+        bloom = revocations.filter
+        self.stdout.write(
+            f"Filter: {bloom.size} bits ({len(bloom.bits) / 1024:.0f} KiB), {bloom.hashes} hashes, built in {build_ms:.0f} ms"
+        )
+        self.stdout.write(
+            f"Not revoked: {filter_us:.1f} us/check with the filter, {table_us:.1f} us/check with a table lookup"
+        )
+        self.stdout.write(
+            f"False positives: {false_positives}/{len(fresh)} ({false_positives / len(fresh):.3%}) went to the database"
+        )
+        if missed:
+            self.stdout.write(self.style.ERROR(f"{missed} revoked tokens were not detected"))
+        else:
+            self.stdout.write(self.style.SUCCESS("All sampled revoked tokens detected"))
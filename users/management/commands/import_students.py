@@ -1,77 +1,149 @@
 import csv
+import os
 import random
 import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.validators import validate_email
+from django.db import connections, transaction
+from users.mail import queue_mass_mail
 from users.models import User
 
+WELCOME_SUBJECT = 'Welcome to GSMP - Your Account Details'
+WELCOME_MESSAGE = '''
+Hello {full_name},
+
+Your GSMP student account has been created!
+
+Here are your login credentials:
+Email: {email}
+Temporary Password: {password}
+
+⚡ IMPORTANT: You must reset your password after first login.
+
+Visit the login page:http://localhost:3000/login
+
+Thanks,
+The GSMP Team
+'''
+
+OPTIONAL_FIELDS = ('id_number', 'phone', 'dob', 'nationality', 'city', 'institutional_affiliation')
+
+
 class Command(BaseCommand):
     help = 'Import students from a CSV file, generate random passwords, email them, and mark password as expired.'
 
     def add_arguments(self, parser):
         parser.add_argument('csv_file', type=str)
+        parser.add_argument('--batch-size', type=int, default=500, help='Students inserted per transaction.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes used to hash passwords.')
+        parser.add_argument('--start-row', type=int, default=1, help='First CSV data row to import (1-based), to resume an import.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be imported without writing anything.')
 
     def generate_password(self, length=10):
         characters = string.ascii_letters + string.digits + "!@#$%^&*"
         return ''.join(random.choice(characters) for _ in range(length))
 
+    def read_rows(self, file_path, start_row):
+        with open(file_path, newline='') as csvfile:
+            for number, row in enumerate(csv.DictReader(csvfile), start=1):
+                if number >= start_row:
+                    yield number, row
+
+    def existing_emails(self, emails, chunk_size=1000):
+        """Emails that already have an account, fetched in a few IN queries."""
+        existing = set()
+        for i in range(0, len(emails), chunk_size):
+            existing.update(User.objects.filter(email__in=emails[i:i + chunk_size]).values_list('email', flat=True))
+        return existing
+
+    def build_user(self, row):
+        """User for a CSV row, raises ValidationError for rows without a usable email."""
+        email = User.objects.normalize_email((row.get('email') or '').strip())
+        validate_email(email)
+        user = User(
+            email=email,
+            first_name=(row.get('first_name') or '').strip(),
+            last_name=(row.get('last_name') or '').strip(),
+            role='student',
+            is_first_login=True,
+            password_expiry=None,
+        )
+        for field in OPTIONAL_FIELDS:
+            setattr(user, field, (row.get(field) or '').strip() or None)
+        return user
+
     def handle(self, *args, **kwargs):
         file_path = kwargs['csv_file']
+        started = time.monotonic()
 
         try:
-            with open(file_path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    email = row['email'].strip()
-                    if User.objects.filter(email=email).exists():
-                        self.stdout.write(self.style.WARNING(f"Skipping existing student: {email}"))
-                        continue
-
-                    temp_password = self.generate_password()
-
-                    user = User.objects.create_user(
-                        email=email,
-                        password=temp_password,
-                        first_name=row['first_name'],
-                        last_name=row['last_name'],
-                        id_number=row.get('id_number'),
-                        phone=row.get('phone'),
-                        dob=row.get('dob'),
-                        nationality=row.get('nationality'),
-                        city=row.get('city'),
-                        institutional_affiliation=row.get('institutional_affiliation'),
-                        role='student',
-                        is_first_login=True,       
-                        password_expiry=None    
-                    )
-
-                    try:
-                        send_mail(
-                            subject='Welcome to GSMP - Your Account Details',
-                            message=f'''
-Hello {user.full_name},
+            rows = list(self.read_rows(file_path, kwargs['start_row']))
+        except FileNotFoundError:
+            self.stdout.write(self.style.ERROR(f"CSV file not found at: {file_path}"))
+            return
 
-Your GSMP student account has been created!
+        candidates, skipped = [], 0
+        for number, row in rows:
+            try:
+                candidates.append((number, self.build_user(row)))
+            except ValidationError:
+                self.stdout.write(self.style.WARNING(f"Row {number}: skipping row without a valid email"))
+                skipped += 1
+        existing = self.existing_emails([user.email for _, user in candidates])
 
-Here are your login credentials:
-Email: {user.email}
-Temporary Password: {temp_password}
+        new, seen = [], set()
+        for number, user in candidates:
+            if user.email in existing or user.email in seen:
+                self.stdout.write(self.style.WARNING(f"Row {number}: skipping existing student {user.email}"))
+                skipped += 1
+                continue
+            seen.add(user.email)
+            new.append((number, user))
 
-⚡ IMPORTANT: You must reset your password after first login.
+        if kwargs['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"[dry run] {len(rows)} rows read, {len(new)} students would be created, {skipped} skipped."
+            ))
+            return
 
-Visit the login page:http://localhost:3000/login
+        # Forked hashing processes must not inherit our database connection
+        connections.close_all()
+        created = 0
+        batch_size = kwargs['batch_size']
+        with ProcessPoolExecutor(max_workers=kwargs['workers']) as pool:
+            for i in range(0, len(new), batch_size):
+                batch = new[i:i + batch_size]
+                passwords = [self.generate_password() for _ in batch]
+                hashes = pool.map(make_password, passwords, chunksize=max(len(batch) // (kwargs['workers'] * 4), 1))
+                for (_, user), password_hash in zip(batch, hashes):
+                    user.password = password_hash
 
-Thanks,  
-The GSMP Team
-''',
-                            from_email=None,  # Uses DEFAULT_FROM_EMAIL
-                            recipient_list=[user.email],
-                            fail_silently=False,
-                        )
-                        self.stdout.write(self.style.SUCCESS(f"Student {email} created and emailed successfully!"))
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"User created but failed to send email to {email}. Error: {str(e)}"))
+                try:
+                    with transaction.atomic():
+                        User.objects.bulk_create([user for _, user in batch])
+                        # Delivered in batches by the send_outbox command
+                        queue_mass_mail([
+                            (WELCOME_SUBJECT,
+                             WELCOME_MESSAGE.format(full_name=user.full_name, email=user.email, password=password),
+                             None, [user.email])
+                            for (_, user), password in zip(batch, passwords)
+                        ])
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(
+                        f"Failed importing rows {batch[0][0]}-{batch[-1][0]}: {e}. "
+                        f"Resume with --start-row {batch[0][0]}"
+                    ))
+                    raise
 
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"CSV file not found at: {file_path}"))
+                created += len(batch)
+                self.stdout.write(f"Imported rows {batch[0][0]}-{batch[-1][0]} ({created}/{len(new)})")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} students and queued their welcome emails, skipped {skipped}, "
+            f"in {elapsed:.1f}s ({created / elapsed if elapsed else 0:.0f} students/s)."
+        ))
@@ -0,0 +1,110 @@
+import logging
+import random
+import secrets
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from users.models import User
+from users.views import LoginView
+
+PASSWORD = secrets.token_urlsafe()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure login latency of legitimate users while bots hammer the login endpoint, '
+        'with and without throttling. Nothing is kept in the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Legitimate users, each logging in from its own IP.')
+        parser.add_argument('--logins', type=int, default=3, help='Logins per legitimate user.')
+        parser.add_argument('--attackers', type=int, default=4, help='Concurrent bot threads.')
+        parser.add_argument('--attacker-ips', type=int, default=2, help='Distinct IPs the bots use.')
+        parser.add_argument('--attack-rate', type=float, default=20, help='Requests per second sent by each bot thread.')
+        parser.add_argument('--warmup', type=float, default=5, help='Seconds the attack runs before legitimate logins are timed.')
+
+    def login(self, view, factory, email, password, ip):
+        request = factory.post('/api/users/login/', {'email': email, 'password': password}, format='json', REMOTE_ADDR=ip)
+        started = time.perf_counter()
+        response = view(request)
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    def attack(self, view, factory, ips, rate, stop, results):
+        # Credential stuffing: random emails, so the hasher always runs
+        interval = 1 / rate
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                code, _ = self.login(view, factory, f'{uuid.uuid4().hex}@example.com', 'guess', random.choice(ips))
+                results.append(code)
+                stop.wait(max(interval - (time.perf_counter() - started), 0))
+        finally:
+            connection.close()
+
+    def run_phase(self, users, options, throttled):
+        factory = APIRequestFactory()
+        original = LoginView.throttle_classes
+        if not throttled:
+            LoginView.throttle_classes = []
+        view = LoginView.as_view()
+        # Fresh addresses so buckets left by an earlier run do not count
+        net = random.randint(1, 250)
+        attacker_ips = [f'10.{net}.0.{i + 1}' for i in range(options['attacker_ips'])]
+
+        stop, attack_results, threads = threading.Event(), [], []
+        try:
+            for _ in range(options['attackers']):
+                thread = threading.Thread(target=self.attack, args=(view, factory, attacker_ips, options['attack_rate'], stop, attack_results))
+                thread.start()
+                threads.append(thread)
+            # An attack in progress has long used up its initial burst
+            time.sleep(options['warmup'] if options['attackers'] else 0)
+
+            timings, failures = [], 0
+            for round_ in range(options['logins']):
+                for i, user in enumerate(users):
+                    code, elapsed = self.login(view, factory, user.email, PASSWORD, f'10.{net}.{1 + round_}.{i + 1}')
+                    timings.append(elapsed)
+                    failures += code != 200
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            LoginView.throttle_classes = original
+
+        label = 'throttled' if throttled else 'unthrottled'
+        rejected = sum(1 for code in attack_results if code == 429)
+        self.stdout.write(
+            f"{label:<12} legit p50 {statistics.median(timings):7.1f} ms  "
+            f"p99 {sorted(timings)[min(int(len(timings) * 0.99), len(timings) - 1)]:7.1f} ms  "
+            f"legit failures {failures}  bot requests {len(attack_results)} ({rejected} got 429)"
+        )
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        # Every rejected bot login would otherwise be logged
+        logging.disable(logging.WARNING)
+        try:
+            # Legitimate logins run on this connection and see the uncommitted users,
+            # the bots use unknown emails on their own connections
+            with transaction.atomic():
+                users = [
+                    User.objects.create_user(
+                        email=f'loadtest-{run}-{i}@example.com', password=PASSWORD,
+                        first_name='Load', last_name='Test', role='student', is_active=True,
+                    )
+                    for i in range(options['users'])
+                ]
+                self.run_phase(users, options, throttled=False)
+                self.run_phase(users, options, throttled=True)
+                # Drop the test users again
+                transaction.set_rollback(True)
+        finally:
+            logging.disable(logging.NOTSET)
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from users.mail import dispatch_outbox, purge_sent, requeue_stale
+
+TIDY_INTERVAL = 60  # seconds
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails in batches over a persistent connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Send what is due and exit.')
+
+    def tidy_outbox(self):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} emails left in 'sending'"))
+        purged = purge_sent()
+        if purged:
+            self.stdout.write(f"Deleted {purged} emails sent more than EMAIL_OUTBOX_RETENTION ago")
+
+    def handle(self, *args, **kwargs):
+        self.tidy_outbox()
+        last_tidy = time.monotonic()
+
+        try:
+            while True:
+                # Another dispatcher may have died since, and old emails expire
+                if time.monotonic() - last_tidy >= TIDY_INTERVAL:
+                    self.tidy_outbox()
+                    last_tidy = time.monotonic()
+                sent, failed = dispatch_outbox(kwargs['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent} emails, {failed} failed")
+                    continue  # more may be waiting
+                if kwargs['once']:
+                    break
+                time.sleep(kwargs['interval'])
+        except KeyboardInterrupt:
+            pass
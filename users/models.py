@@ -2,7 +2,11 @@
 
 # Create your models here.
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from backend.storage import TrackedFilesMixin, blob_storage
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -19,7 +23,7 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True)
         return self.create_user(email, password, **extra_fields)
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(TrackedFilesMixin, AbstractBaseUser, PermissionsMixin):
     ROLE_CHOICES = (
         ('admin', 'Admin'),
         ('mentor', 'Mentor'),
@@ -34,8 +38,6 @@ class User(AbstractBaseUser, PermissionsMixin):
    
 
     email = models.EmailField(unique=True)
-    email_otp = models.CharField(max_length=6, blank=True, null=True)  # NEW FIELD
-    otp_created_at = models.DateTimeField(blank=True, null=True)
 
     title = models.CharField(max_length=255, blank=True)
     first_name = models.CharField(max_length=255, blank=True)
@@ -53,7 +55,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     institutional_affiliation= models.CharField(max_length=100, blank=True, null=True)
     nationality = models.CharField(max_length=100, blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
-    mentor_intro_video = models.FileField(upload_to='mentor_videos/', blank=True, null=True)
+    mentor_intro_video = models.FileField(upload_to='mentor_videos/', storage=blob_storage, blank=True, null=True)
     password_expiry = models.DateTimeField(blank=True, null=True)  # For students
     is_first_login = models.BooleanField(default=True)
 
@@ -61,10 +63,25 @@ class User(AbstractBaseUser, PermissionsMixin):
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+    TRACKED_FILE_FIELDS = ('mentor_intro_video',)
 
     def __str__(self):
         return self.email
 
+    def save(self, *args, **kwargs):
+        # content.models imports this module, so blobs are imported here
+        from content.blobs import swap_blob
+
+        video_changed = self.file_changed('mentor_intro_video', kwargs.get('update_fields'))
+        if not video_changed:
+            # Logins save here, without a savepoint around their single UPDATE
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                swap_blob(self.loaded_file_name('mentor_intro_video'), self.mentor_intro_video.name)
+        self._remember_files()
+
 
 class Pairing(models.Model):
     mentor = models.ForeignKey(
@@ -85,3 +102,74 @@ class Pairing(models.Model):
 
     def __str__(self):
         return f"{self.mentor.full_name} ↔ {self.student.full_name}"
+
+
+
+class OutboundEmail(models.Model):
+    """An email waiting in the outbox, one row per recipient."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField(help_text="Blanked once sent, it may hold a one-time code or a temporary password")
+    from_email = models.CharField(max_length=255, blank=True, help_text="Empty means DEFAULT_FROM_EMAIL")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+
+
+class RevokedToken(models.Model):
+    """A JWT that must no longer be accepted, identified by its ``jti`` claim."""
+    jti = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='revoked_tokens')
+    expires_at = models.DateTimeField(help_text="When the token expires anyway; the row can be purged after that")
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-revoked_at']
+        indexes = [models.Index(fields=['expires_at'])]
+
+    def __str__(self):
+        return f"{self.jti} (user {self.user_id})"
+
+@receiver(pre_delete, sender=User)
+def release_mentor_intro_video(sender, instance, **kwargs):
+    from content.blobs import release_blob
+
+    release_blob(instance.mentor_intro_video.name)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the user from the authentication cache after any change (role, activation, password...)."""
+    from .authentication import user_cache
+
+    user_cache.invalidate(str(instance.pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_firebase_token(sender, instance, update_fields=None, **kwargs):
+    """Cached Firebase custom tokens carry the name and email as claims."""
+    if update_fields is not None and not update_fields & {'first_name', 'last_name', 'email'}:
+        return
+    from .firebase.firebase import firebase_uid, invalidate_custom_token
+
+    invalidate_custom_token(firebase_uid(instance))
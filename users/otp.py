@@ -0,0 +1,59 @@
+"""One-time passwords kept in a cache backend instead of the users table.
+
+A code lives under ``otp:<purpose>:<email hash>`` for OTP_TTL seconds
+next to an attempt counter with the same lifetime. Verifying increments
+the counter atomically, so a code can be guessed at most
+OTP_MAX_ATTEMPTS times, and a correct code is deleted on use.
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+
+class OTPError(Exception):
+    pass
+
+
+def _cache():
+    return caches[settings.OTP_CACHE_ALIAS]
+
+
+def _keys(email, purpose):
+    digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+    return f'otp:{purpose}:{digest}', f'otp:{purpose}:{digest}:attempts'
+
+
+def issue_otp(email, purpose):
+    """Create a new code for ``email``, replacing any earlier one, and return it."""
+    code = f'{secrets.randbelow(1_000_000):06d}'
+    code_key, attempts_key = _keys(email, purpose)
+    _cache().set_many({code_key: code, attempts_key: 0}, timeout=settings.OTP_TTL)
+    return code
+
+
+def verify_otp(email, purpose, code):
+    """Consume the code for ``email`` or raise OTPError."""
+    cache = _cache()
+    code_key, attempts_key = _keys(email, purpose)
+
+    stored = cache.get(code_key)
+    if stored is None:
+        raise OTPError('OTP expired. Please request a new one.')
+    try:
+        attempts = cache.incr(attempts_key)
+    except ValueError:
+        # Counter expired between the two reads
+        raise OTPError('OTP expired. Please request a new one.')
+    if attempts > settings.OTP_MAX_ATTEMPTS:
+        cache.delete_many([code_key, attempts_key])
+        raise OTPError('Too many attempts. Please request a new OTP.')
+    if not constant_time_compare(stored, str(code)):
+        raise OTPError('Invalid OTP')
+
+    # Whoever deletes the key first wins, so a code is only ever used once
+    if not cache.delete(code_key):
+        raise OTPError('OTP expired. Please request a new one.')
+    cache.delete(attempts_key)
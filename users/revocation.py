@@ -0,0 +1,126 @@
+"""Revoked JWTs, checked through an in-memory Bloom filter.
+
+Revoked ``jti``s are stored in the RevokedToken table. Each worker
+mirrors them into a Bloom filter and pulls new rows at most every
+JWT_REVOCATION_REFRESH seconds, so a token that was never revoked is
+cleared with a few hash lookups and no query. Only filter hits, which
+include the occasional false positive, are confirmed against the table.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# Rows committed slightly out of order are still picked up on the next refresh
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / self.capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        # Double hashing: k positions from two 64-bit halves
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        """Add an item, returning False if it was (or looked) already present.
+
+        Refreshes re-read an overlapping window of rows, so only items that
+        set a new bit are counted; ``count`` can only fall short by the odd
+        false positive.
+        """
+        added = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationList:
+    def __init__(self, capacity=None, error_rate=None, refresh_interval=None):
+        self.capacity = capacity or settings.JWT_REVOCATION_CAPACITY
+        self.error_rate = error_rate or settings.JWT_REVOCATION_ERROR_RATE
+        self.refresh_interval = settings.JWT_REVOCATION_REFRESH if refresh_interval is None else refresh_interval
+        self.filter = None
+        self.synced_at = None
+        self.next_refresh = 0
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        now = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True))
+        # Leave room to grow before the next rebuild
+        bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self.filter, self.synced_at = bloom, now
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() < self.next_refresh:
+            return
+        with self._lock:
+            if not force and time.monotonic() < self.next_refresh:
+                return
+            if self.filter is None:
+                self._rebuild()
+            else:
+                now = timezone.now()
+                for jti in RevokedToken.objects.filter(
+                    revoked_at__gte=self.synced_at - REFRESH_OVERLAP
+                ).values_list('jti', flat=True):
+                    self.filter.add(jti)
+                self.synced_at = now
+                if self.filter.count > self.filter.capacity:
+                    self._rebuild()
+            self.next_refresh = time.monotonic() + self.refresh_interval
+
+    def is_revoked(self, jti):
+        self.refresh()
+        if jti not in self.filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def add(self, jti):
+        """Make a revocation visible in this process without waiting for a refresh."""
+        self.refresh()
+        with self._lock:
+            self.filter.add(jti)
+
+
+revocation_list = RevocationList()
+
+
+def revoke_token(token, user=None):
+    """Revoke a validated simplejwt token (access or refresh) until it expires."""
+    jti = token[api_settings.JTI_CLAIM]
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at, 'user': user})
+    revocation_list.add(jti)
+
+
+def purge_expired():
+    """Delete revocations of tokens that have expired anyway."""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
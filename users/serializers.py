@@ -1,25 +1,32 @@
 from rest_framework import serializers
 from .models import User
-from django.contrib.auth import get_user_model, authenticate
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 import random, os
-from django.core.mail import send_mail
+from django.db import transaction
 from django.contrib.auth.hashers import check_password
+from backend.media import media_url
+from .mail import queue_mail
+from content.uploads import UploadError, claim_upload
 
 
 # --- Mentor Registration ---
 class MentorRegisterSerializer(serializers.ModelSerializer):
     MAX_VIDEO_SIZE = 150 * 1024 * 1024  # 150MB
 
-    mentor_intro_video = serializers.FileField(required=False)
+    mentor_intro_video = serializers.FileField(required=False, write_only=True)
+    # A finalized resumable upload can be given instead of mentor_intro_video
+    upload_id = serializers.UUIDField(write_only=True, required=False)
     
     class Meta:
         model = User
-        fields = ('id','email', 'first_name','last_name', 'title', 'dob','id_number', 'phone','bio' ,'job_title', 'institutional_affiliation','nationality', 'city','mentor_intro_video')
+        fields = ('id','email', 'first_name','last_name', 'title', 'dob','id_number', 'phone','bio' ,'job_title', 'institutional_affiliation','nationality', 'city','mentor_intro_video','upload_id')
 
     def validate(self, data):
         # Validate video file if provided
         video = data.get('mentor_intro_video')
+        if video and data.get('upload_id'):
+            raise serializers.ValidationError("Provide either mentor_intro_video or upload_id, not both.")
         if video:
             # Check file size (limit to 50MB)
             # if video.size > 50 * 1024 * 1024:  # 50MB in bytes
@@ -45,6 +52,7 @@ class MentorRegisterSerializer(serializers.ModelSerializer):
         logger = logging.getLogger(__name__)
 
         video_file = validated_data.pop('mentor_intro_video', None)
+        upload_id = validated_data.pop('upload_id', None)
         
         # Generate a random password with 10 characters including letters, digits, and special characters
         password_characters = string.ascii_letters + string.digits + "!@#$%^&*()"
@@ -60,27 +68,37 @@ class MentorRegisterSerializer(serializers.ModelSerializer):
         else:
             logger.info("No video file in validated_data")
             
-        # Create user with auto-generated password
-        user = User.objects.create_user(password=auto_password, **validated_data)
+        with transaction.atomic():
+            if upload_id:
+                # Already in place from the resumable upload, only the name is stored
+                # Sessions opened while signed in can only be claimed by the same user
+                user = self.context['request'].user
+                try:
+                    validated_data['mentor_intro_video'] = claim_upload(
+                        upload_id, 'mentor_intro_video', user if user.is_authenticated else None,
+                    )
+                except UploadError as e:
+                    raise serializers.ValidationError({"upload_id": str(e)})
+
+            # Create user with auto-generated password
+            user = User.objects.create_user(password=auto_password, **validated_data)
 
-        
-        # Ensure the video is saved properly
-        if video_file:
-            ext = os.path.splitext(video_file.name)[1]  # keep original extension (.mp4, .mov, etc.)
-            safe_name = f"{user.first_name.lower()}_{user.last_name.lower()}_intro{ext}"
-            user.mentor_intro_video.save(safe_name, video_file, save=True)
-            logger.info(f"Saved user with video: {user.mentor_intro_video}")
+            
+            # Ensure the video is saved properly
+            if video_file:
+                # Stored under the hash of its content, only the extension of the name is kept
+                user.mentor_intro_video.save(video_file.name, video_file, save=True)
+                logger.info(f"Saved user with video: {user.mentor_intro_video}")
 
-        
+            
 
-        # Send confirmation email to mentor
-        send_mail(
-            subject="AIMS GMSP Mentor Application",
-            message="Thank You for applying as a mentor to the AIMS GMSP.\nWe will reach out to you via email once you're selected.",
-            from_email=None,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
+            # Queue confirmation email to mentor
+            queue_mail(
+                subject="AIMS GMSP Mentor Application",
+                message="Thank You for applying as a mentor to the AIMS GMSP.\nWe will reach out to you via email once you're selected.",
+                from_email=None,
+                recipient_list=[user.email],
+            )
         return user
     
     
@@ -96,19 +114,32 @@ class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Fields changed during validation, saved by LoginView in its single UPDATE
+        self.update_fields = set()
+
     def validate(self, data):
         email = data.get('email')
         password = data.get('password')
 
+        # One query for every role; authenticate() would fetch the row again
         try:
             user = User.objects.get(email=email)
         except User.DoesNotExist:
+            # Hash anyway, like ModelBackend, so timing does not reveal unknown emails
+            User().set_password(password)
             raise serializers.ValidationError("Invalid credentials.")
 
-        if user.role == 'student':
-            if not check_password(password, user.password):
-                raise serializers.ValidationError("Invalid credentials.")
+        def upgrade_hash(raw_password):
+            # Hasher settings changed, store the new hash with the login UPDATE
+            user.set_password(raw_password)
+            self.update_fields.add('password')
+
+        if not check_password(password, user.password, setter=upgrade_hash):
+            raise serializers.ValidationError("Invalid credentials.")
 
+        if user.role == 'student':
             if not user.is_active:
                 # Student must reset password before activation
                 raise serializers.ValidationError({"is_first_login": True})
@@ -118,9 +149,8 @@ class LoginSerializer(serializers.Serializer):
 
             return user
 
-        # Mentor or other roles
-        user = authenticate(email=email, password=password)
-        if not user:
+        # Mentor or other roles: inactive accounts are refused, as by ModelBackend
+        if not user.is_active:
             raise serializers.ValidationError("Invalid credentials.")
 
         return user
@@ -154,8 +184,8 @@ class UserSerializer(serializers.ModelSerializer):
         if obj.mentor_intro_video and hasattr(obj.mentor_intro_video, 'url'):
             request = self.context.get('request')
             if request is not None:
-                return request.build_absolute_uri(obj.mentor_intro_video.url)
-            return obj.mentor_intro_video.url
+                return request.build_absolute_uri(media_url(obj.mentor_intro_video))
+            return media_url(obj.mentor_intro_video)
         return None
 
 
@@ -1,3 +1,410 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .firebase.fake import FakeFirestore
+from communication.models import ChatMessage
+from .firebase import firebase
+from .firebase.firebase import get_db
+from .firebase.writer import FirestoreWriter, writer
+from .authentication import user_cache
+from .mail import dispatch_outbox, purge_sent, queue_mail
+from .models import OutboundEmail, RevokedToken, User
+from .otp import OTPError, issue_otp, verify_otp
+from .revocation import RevocationList, revoke_token
+
+
+class FlakyFirestore(FakeFirestore):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def _commit(self, writes):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('Firestore unavailable')
+        return super()._commit(writes)
+
+
+class FirestoreWriterTests(TestCase):
+    def test_writes_are_batched(self):
+        db = FakeFirestore()
+        writer = FirestoreWriter(client=lambda: db, batch_size=10, flush_interval=0.05)
+        ids = [writer.submit('chats/a/messages', {'text': str(i)}) for i in range(25)]
+        self.assertTrue(writer.flush(timeout=5))
+
+        self.assertEqual(len(set(ids)), 25)
+        self.assertEqual(db.commits, 3)
+        stored = {doc.id: doc.get('text') for doc in db.collection('chats/a/messages').stream()}
+        self.assertEqual(stored, {id: str(i) for i, id in enumerate(ids)})
+
+    def test_failed_batches_are_retried(self):
+        db = FlakyFirestore(failures=2)
+        writer = FirestoreWriter(client=lambda: db, max_retries=3)
+        committed = []
+        writer.on_commit(committed.extend)
+        document_id = writer.submit('chats/a/messages', {'text': 'hi'})
+        self.assertTrue(writer.flush(timeout=5))
+
+        self.assertTrue(db.collection('chats/a/messages').document(document_id).get().exists)
+        self.assertEqual([write.document_id for write in committed], [document_id])
+        self.assertEqual((writer.committed, writer.failed), (1, 0))
+
+    def test_writes_are_dropped_after_max_retries(self):
+        db = FlakyFirestore(failures=10)
+        writer = FirestoreWriter(client=lambda: db, max_retries=1)
+        with self.assertLogs('users.firebase.writer', 'ERROR'):
+            writer.submit('chats/a/messages', {'text': 'hi'})
+            self.assertTrue(writer.flush(timeout=5))
+        self.assertEqual((writer.committed, writer.failed), (0, 1))
+
+
+@override_settings(FIREBASE_USE_FAKE=True)
+class SendMessageTests(TransactionTestCase):
+    # The writer thread commits and mirrors the message on its own connection
+    def test_message_is_acknowledged_with_its_id(self):
+        user = User.objects.create_user(email='mentor@example.com', password='pass', role='mentor', is_active=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/users/send-message/', {'chat_id': 'chat-1', 'text': ' hello '})
+        self.assertEqual(response.status_code, 200)
+        writer.flush(timeout=5)
+
+        message = get_db().collection('chats').document('chat-1').collection('messages').document(response.data['message_id']).get()
+        self.assertEqual(message.get('text'), 'hello')
+        self.assertEqual(message.get('senderId'), user.id)
+        mirrored = ChatMessage.objects.get(message_id=response.data['message_id'])
+        self.assertEqual((mirrored.chat_id, mirrored.sender_id), ('chat-1', user.id))
+
+    def test_only_participants_can_write_to_named_chat(self):
+        user = User.objects.create_user(email='mentor@example.com', password='pass', role='mentor', is_active=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post('/api/users/send-message/', {'chat_id': f'{user.id + 1}-{user.id + 2}', 'text': 'hello'})
+        self.assertEqual(response.status_code, 403)
+
+
+class FirebaseInitializationTests(SimpleTestCase):
+    def setUp(self):
+        # Leave the process-wide app and client as they were
+        self.enterContext(mock.patch.multiple(firebase, _pid=None, _app=None, _db=None))
+
+    def test_import_does_not_initialize(self):
+        code = (
+            "import sys, django; django.setup(); import backend.urls; from users.firebase import firebase; "
+            "print(firebase._app, firebase._db, 'firebase_admin' in sys.modules)"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env, timeout=60, check=True)
+        self.assertEqual(result.stdout.split(), ['None', 'None', 'False'])
+
+    @override_settings(FIREBASE_USE_FAKE=True)
+    def test_new_process_gets_its_own_client(self):
+        db = get_db()
+        self.assertIs(get_db(), db)
+        with mock.patch.object(firebase.os, 'getpid', return_value=os.getpid() + 1):
+            child_db = get_db()
+            self.assertIsNot(child_db, db)
+            self.assertIs(get_db(), child_db)
+
+    def test_new_process_initializes_its_own_app(self):
+        with mock.patch.object(firebase, '_credentials', return_value={}), \
+                mock.patch('firebase_admin.credentials.Certificate'), \
+                mock.patch('firebase_admin.initialize_app', side_effect=lambda cred, name: object()) as initialize:
+            app = firebase.get_app()
+            self.assertIs(firebase.get_app(), app)
+            with mock.patch.object(firebase.os, 'getpid', return_value=os.getpid() + 1):
+                self.assertIsNot(firebase.get_app(), app)
+        self.assertEqual(
+            [call.kwargs['name'] for call in initialize.call_args_list],
+            [f'gmsp-{os.getpid()}', f'gmsp-{os.getpid() + 1}'],
+        )
+
+
+@override_settings(FIREBASE_USE_FAKE=True)
+class FirebaseTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='mentor@example.com', password='pass', role='mentor', is_active=True, first_name='Ada', last_name='L',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_token(self):
+        response = self.client.get('/api/users/firebase-token/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['firebase_token']
+
+    def test_token_is_signed_once(self):
+        with mock.patch.object(firebase, 'create_custom_token', wraps=firebase.create_custom_token) as create:
+            first = self.get_token()
+            self.get_token()
+            self.assertEqual(self.get_token(), first)
+        self.assertEqual(create.call_count, 1)
+
+    def test_name_change_invalidates_token(self):
+        with mock.patch.object(firebase, 'create_custom_token', wraps=firebase.create_custom_token) as create:
+            self.get_token()
+            self.user.save(update_fields=['is_active'])
+            self.get_token()
+            self.assertEqual(create.call_count, 1)
+
+            self.user.first_name = 'Grace'
+            self.user.save(update_fields=['first_name'])
+            self.assertIsNone(cache.get(f'firebase-token:{firebase.firebase_uid(self.user)}'))
+            self.get_token()
+        self.assertEqual(create.call_count, 2)
+
+
+class UnreachableBackend(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class FlakyBackend(EmailBackend):
+    """Fails the first message, and counts how often a session is opened."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+        self.is_open = False
+        self.failures = 1
+
+    def open(self):
+        if not self.is_open:
+            self.opened += 1
+            self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('Connection reset')
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        queue_mail('Hello', 'Body', ['a@example.com', 'b@example.com', 'c@example.com'])
+
+    def test_unreachable_server_defers_the_batch(self):
+        with self.assertLogs('users.mail', 'WARNING'):
+            self.assertEqual(dispatch_outbox(connection=UnreachableBackend()), (0, 3))
+
+        for email in OutboundEmail.objects.all():
+            self.assertEqual((email.status, email.attempts), ('pending', 0))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(dispatch_outbox(), (0, 0))  # not due yet
+
+    def test_connection_is_reopened_after_a_failed_message(self):
+        connection = FlakyBackend()
+        with self.assertLogs('users.mail', 'WARNING'):
+            self.assertEqual(dispatch_outbox(connection=connection), (2, 1))
+
+        self.assertEqual(connection.opened, 2)
+        self.assertEqual(len(mail.outbox), 2)
+        statuses = sorted(OutboundEmail.objects.values_list('status', flat=True))
+        self.assertEqual(statuses, ['pending', 'sent', 'sent'])
+
+    def test_sent_bodies_are_not_kept(self):
+        queue_mail('Your OTP Code', 'Your OTP is: 123456', ['d@example.com'])
+        self.assertEqual(dispatch_outbox(), (4, 0))
+
+        self.assertIn('Your OTP is: 123456', [message.body for message in mail.outbox])
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', 'body')), {('sent', '')})
+
+    def test_old_sent_emails_are_purged(self):
+        dispatch_outbox()
+        queue_mail('Later', 'Body', ['d@example.com'])
+        self.assertEqual(purge_sent(3600), 0)
+        OutboundEmail.objects.filter(status='sent').update(sent_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(purge_sent(3600), 3)
+        self.assertEqual(list(OutboundEmail.objects.values_list('status', flat=True)), ['pending'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginQueryTests(TestCase):
+    """A login reads the user once and writes at most one UPDATE."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, user, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.post('/api/users/login/', {'email': user.email, 'password': 'pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_first_and_repeat_mentor_login(self):
+        mentor = User.objects.create_user(email='mentor@example.com', password='pass', role='mentor', is_active=True)
+        self.login(mentor, 2)  # clears is_first_login
+        self.login(mentor, 1)
+
+    def test_first_and_repeat_student_login(self):
+        student = User.objects.create_user(
+            email='student@example.com', password='pass', role='student', is_active=True,
+            password_expiry=timezone.now() + timedelta(days=1),
+        )
+        self.login(student, 2)  # clears the expiry
+        self.login(student, 1)
+
+    def test_outdated_hash_is_upgraded_in_the_same_update(self):
+        mentor = User.objects.create_user(
+            email='mentor@example.com', password='pass', role='mentor', is_active=True, is_first_login=False,
+        )
+        with override_settings(PASSWORD_HASHERS=[
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher',
+        ]):
+            self.login(mentor, 2)
+        mentor.refresh_from_db()
+        self.assertTrue(mentor.password.startswith('pbkdf2_sha256$'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportStudentsTests(TestCase):
+    rows = [
+        'email,first_name,last_name,city',
+        'ada@example.com,Ada,Lovelace,London',
+        'Existing@example.com,Old,Student,',
+        'not-an-email,Bad,Row,',
+        ',Empty,Row,',
+        'grace@EXAMPLE.com,Grace,Hopper,',
+        'ada@example.com,Ada,Again,',
+    ]
+
+    def setUp(self):
+        User.objects.create_user(email='Existing@example.com', password='pass', role='student', is_active=True)
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(self.rows) + '\n')
+
+    def import_students(self, *args):
+        out = StringIO()
+        call_command('import_students', self.path, '--workers', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_new_students_are_created_and_emailed(self):
+        out = self.import_students()
+        self.assertIn('Created 2 students', out)
+        self.assertIn('skipped 4', out)
+
+        ada = User.objects.get(email='ada@example.com')
+        self.assertEqual((ada.last_name, ada.city, ada.role, ada.is_first_login), ('Lovelace', 'London', 'student', True))
+        self.assertTrue(User.objects.filter(email='grace@example.com').exists())
+        self.assertEqual(User.objects.filter(email__iexact='existing@example.com').count(), 1)
+        self.assertEqual(User.objects.count(), 3)
+
+        emails = OutboundEmail.objects.order_by('to_email')
+        self.assertEqual([e.to_email for e in emails], ['ada@example.com', 'grace@example.com'])
+        password = emails[0].body.split('Temporary Password: ')[1].split()[0]
+        self.assertTrue(check_password(password, ada.password))
+
+    def test_dry_run_writes_nothing(self):
+        self.assertIn('2 students would be created, 4 skipped', self.import_students('--dry-run'))
+        self.assertEqual(User.objects.count(), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(email='mentor@example.com', password='pass', role='mentor', is_active=True)
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+        self.url = f'/api/users/users/{self.user.id}/'
+
+    def test_revoked_tokens_are_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.post('/api/users/logout/', {'refresh': str(self.refresh)})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(RevokedToken.objects.filter(user=self.user).count(), 2)
+
+    def test_saving_a_user_drops_the_cached_copy(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertIsNotNone(user_cache.get(str(self.user.id)))
+
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertIsNone(user_cache.get(str(self.user.id)))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_overlapping_refreshes_do_not_inflate_the_count(self):
+        revocations = RevocationList(capacity=10, refresh_interval=0)
+        revocations.refresh(force=True)
+        for _ in range(3):
+            revoke_token(RefreshToken.for_user(self.user))
+        jtis = list(RevokedToken.objects.values_list('jti', flat=True))
+        for jti in jtis:
+            revocations.add(jti)
+        for _ in range(5):
+            revocations.refresh(force=True)
+
+        self.assertEqual(revocations.filter.count, 3)
+        self.assertTrue(all(revocations.is_revoked(jti) for jti in jtis))
+        self.assertFalse(revocations.is_revoked('never-revoked'))
+
+
+@override_settings(OTP_TTL=600, OTP_MAX_ATTEMPTS=3)
+class OTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_code_is_single_use(self):
+        code = issue_otp('Student@Example.com', 'verify')
+        verify_otp('student@example.com ', 'verify', code)
+        with self.assertRaisesMessage(OTPError, 'expired'):
+            verify_otp('student@example.com', 'verify', code)
+
+    def test_codes_are_scoped_to_a_purpose(self):
+        code = issue_otp('student@example.com', 'verify')
+        with self.assertRaisesMessage(OTPError, 'expired'):
+            verify_otp('student@example.com', 'reset', code)
+
+    def test_reissuing_replaces_the_code(self):
+        old = issue_otp('student@example.com', 'verify')
+        new = issue_otp('student@example.com', 'verify')
+        if old != new:
+            with self.assertRaisesMessage(OTPError, 'Invalid'):
+                verify_otp('student@example.com', 'verify', old)
+        verify_otp('student@example.com', 'verify', new)
+
+    def test_attempts_are_limited(self):
+        code = issue_otp('student@example.com', 'verify')
+        wrong = f'{(int(code) + 1) % 1_000_000:06d}'
+        for _ in range(3):
+            with self.assertRaisesMessage(OTPError, 'Invalid'):
+                verify_otp('student@example.com', 'verify', wrong)
+        with self.assertRaisesMessage(OTPError, 'Too many attempts'):
+            verify_otp('student@example.com', 'verify', code)
+        with self.assertRaisesMessage(OTPError, 'expired'):
+            verify_otp('student@example.com', 'verify', code)
+
+    def test_code_expires(self):
+        code = issue_otp('student@example.com', 'verify')
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 601):
+            with self.assertRaisesMessage(OTPError, 'expired'):
+                verify_otp('student@example.com', 'verify', code)
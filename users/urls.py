@@ -3,6 +3,7 @@ from .views import (
     MentorRegisterView,
     VerifyOTPView,
     LoginView,
+    LogoutView,
     PasswordResetView,
     SendOTPView,
     list_students,
@@ -10,11 +11,13 @@ from .views import (
     send_message_view,
     get_firebase_token,
     get_user,
+    MentorIntroVideoView,
 )
 
 urlpatterns = [
     path('register/mentor/', MentorRegisterView.as_view(), name='mentor-register'),
     path('login/', LoginView.as_view(), name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('verify-otp/', VerifyOTPView.as_view(), name='verify-otp'),
     path('password-reset/', PasswordResetView.as_view(), name='password-reset'),
     path('students/', list_students, name='list_students'),
@@ -23,6 +26,7 @@ urlpatterns = [
     path('send-message/', send_message_view,name='send-mrssage'),
     path('firebase-token/', get_firebase_token),
     path('users/<int:user_id>/', get_user, name='get-user'),
+    path('mentors/<int:user_id>/intro-video/', MentorIntroVideoView.as_view(), name='mentor-intro-video'),
 
 
 
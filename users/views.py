@@ -1,18 +1,29 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
-from datetime import timedelta,datetime
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
-from django.core.mail import send_mail
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.parsers import MultiPartParser, FormParser
-from .firebase.firebase import db
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from .firebase.firebase import cached_custom_token, firebase_uid
+from .firebase.writer import WriterOverloaded, writer
+from .mail import queue_mail
+from .otp import OTPError, issue_otp, verify_otp
+from .revocation import revoke_token
+from backend.media import IgnoreClientContentNegotiation, ranged_file_response
+from backend.pagination import IdCursorPagination
+from backend.throttling import EmailTokenBucketThrottle, IPTokenBucketThrottle
+from communication.models import chat_participants
+from content.upload_handlers import VideoUploadValidationMixin
 
 import logging
-import random
 
 
 from .models import User,Pairing
@@ -27,10 +38,15 @@ from .serializers import (
 logger = logging.getLogger(__name__)
 
 # --- Mentor Registration ---
-class MentorRegisterView(generics.CreateAPIView):
+class MentorRegisterView(VideoUploadValidationMixin, generics.CreateAPIView):
     serializer_class = MentorRegisterSerializer
     permission_classes = [AllowAny]
     parser_classes = [MultiPartParser, FormParser]
+    # Checked by signature and size while the body streams in
+    video_upload_fields = {'mentor_intro_video': 'mentor_intro_video'}
+    # IP only: an email bucket would have to parse the whole upload first
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = 'register'
     
     def post(self, request, *args, **kwargs):
         # Log the request content type and files
@@ -53,6 +69,8 @@ from rest_framework.exceptions import AuthenticationFailed
 
 class LoginView(generics.GenericAPIView):
     serializer_class = LoginSerializer
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'login'
 
     def post(self, request):
         try:
@@ -68,6 +86,8 @@ class LoginView(generics.GenericAPIView):
 
             password_expired = False
             is_first_login = False
+            # Collected here and written with a single UPDATE
+            update_fields = set(serializer.update_fields)
 
             # Logic specific to student accounts
             if user.role == 'student':
@@ -79,19 +99,22 @@ class LoginView(generics.GenericAPIView):
                 if not user.is_active:
                     is_first_login = True
                     user.is_active = True  # Mark as active after first login
-                    user.save()
+                    update_fields.add('is_active')
                     logger.info(f"Activated student account: {user.email}")
 
                 # If password hasn't expired and account is active, clear the expiry date
-                if user.is_active and not password_expired:
+                if user.is_active and not password_expired and user.password_expiry is not None:
                     user.password_expiry = None
-                    user.save()
+                    update_fields.add('password_expiry')
                     logger.info(f"Cleared password expiry for: {user.email}")
 
-            # For mentors, set 'is_first_time_login' to False once they log in
-            if user.role == 'mentor' and user.is_active:
-                user.is_first_time_login = False  # Update first-time login flag
-                user.save()
+            # For mentors, clear the first-login flag once they log in
+            if user.role == 'mentor' and user.is_active and user.is_first_login:
+                user.is_first_login = False
+                update_fields.add('is_first_login')
+
+            if update_fields:
+                user.save(update_fields=update_fields)
 
             # Generate refresh and access tokens for the user
             refresh = RefreshToken.for_user(user)
@@ -126,7 +149,30 @@ class LoginView(generics.GenericAPIView):
         except Exception as e:
             logger.error(f"Unexpected error in LoginView: {e}")
             return Response({"detail": "Internal Server Error"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+
+
+class LogoutView(generics.GenericAPIView):
+    """Revoke the access token of the request, and the refresh token if one is posted."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        refresh = None
+        if request.data.get('refresh'):
+            try:
+                refresh = RefreshToken(request.data['refresh'])
+            except TokenError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if str(refresh.get(jwt_settings.USER_ID_CLAIM)) != str(request.user.pk):
+                return Response({'error': 'Refresh token belongs to another user.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            revoke_token(request.auth, user=request.user)
+            if refresh is not None:
+                revoke_token(refresh, user=request.user)
+
+        return Response({'message': 'Logged out.'}, status=status.HTTP_200_OK)
+
+
 class VerifyOTPView(generics.GenericAPIView):
     permission_classes = [AllowAny]
 
@@ -138,62 +184,46 @@ class VerifyOTPView(generics.GenericAPIView):
         if not email or not otp:
             return Response({'error': 'Email and OTP are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-
         try:
-            user = User.objects.get(email=email)
-
-            # ✅ Check if OTP expired (valid for 10 minutes)
-            if user.otp_created_at and timezone.now() > user.otp_created_at + timedelta(minutes=10):
-                return Response({'error': 'OTP expired. Please request a new one.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            if user.email_otp != otp:
-                return Response({'error': 'Invalid OTP'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # ✅ Correct OTP, Activate account
-            if purpose == 'registration':
-                user.is_active = True  # Only activate account during registration
-            user.email_otp = None
-            user.otp_created_at = None
-            user.save()
-
-            return Response({'message': f'Email verified successfully for {purpose}. You can now login.'})
+            verify_otp(email, purpose, otp)
+        except OTPError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ✅ Correct OTP, activate a pending account (only during registration)
+        if purpose == 'registration':
+            user = User.objects.filter(email=email, is_active=False).first()
+            if user is not None:
+                user.is_active = True
+                user.save(update_fields=['is_active'])
 
-        except User.DoesNotExist:
-            return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': f'Email verified successfully for {purpose}. You can now login.'})
 
 
 
 class ResendOTPView(generics.GenericAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'otp'
 
     def post(self, request):
         email = request.data.get('email')
 
-        try:
-            user = User.objects.get(email=email)
-            if user.is_active:
-                return Response({'error': 'Account is already active.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Generate a new OTP
-            otp = str(random.randint(100000, 999999))
-            user.email_otp = otp
-            user.otp_created_at = timezone.now()  # 🆕 Save the time
-            user.save()
-
-
-            # Send the new OTP
-            send_mail(
-                subject="Your New GSMP Verification OTP",
-                message=f"Your new OTP is {otp}",
-                from_email="noreply@gsmp.com",
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
-
-            return Response({'message': 'New OTP sent to your email.'})
-        
-        except User.DoesNotExist:
+        is_active = User.objects.filter(email=email).values_list('is_active', flat=True).first()
+        if is_active is None:
             return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+        if is_active:
+            return Response({'error': 'Account is already active.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Generate a new OTP
+        otp = issue_otp(email, 'registration')
+        queue_mail(
+            subject="Your New GSMP Verification OTP",
+            message=f"Your new OTP is {otp}",
+            from_email="noreply@gsmp.com",
+            recipient_list=[email],
+        )
+
+        return Response({'message': 'New OTP sent to your email.'})
 
 
 
@@ -230,8 +260,10 @@ class PasswordResetView(generics.GenericAPIView):
 @permission_classes([IsAuthenticated])
 def list_students(request):
     students = User.objects.filter(role='student', is_active=True)
-    serializer = UserSerializer(students, many=True, context={'request': request})
-    return Response(serializer.data)
+    paginator = IdCursorPagination()
+    page = paginator.paginate_queryset(students, request)
+    serializer = UserSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
@@ -240,22 +272,40 @@ def paired_users_view(request):
     user = request.user
 
     if user.role == 'mentor':
-        students = [p.student for p in Pairing.objects.filter(mentor=user)]
-        serializer = UserSerializer(students, many=True, context={'request': request})
-        return Response({'paired_students': serializer.data})
-    
+        key, users = 'paired_students', User.objects.filter(paired_mentors__mentor=user)
     elif user.role == 'student':
-        mentors = [p.mentor for p in Pairing.objects.filter(student=user)]
-        serializer = UserSerializer(mentors, many=True, context={'request': request})
-        return Response({'paired_mentors': serializer.data})
-    
-    return Response({'error': 'Invalid role'}, status=400)
+        key, users = 'paired_mentors', User.objects.filter(paired_students__student=user)
+    else:
+        return Response({'error': 'Invalid role'}, status=400)
 
+    paginator = IdCursorPagination()
+    page = paginator.paginate_queryset(users, request)
+    serializer = UserSerializer(page, many=True, context={'request': request})
+    return Response({
+        key: serializer.data,
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+    })
 
 
 
+
+class MentorIntroVideoView(generics.GenericAPIView):
+    """Stream a mentor's intro video, supporting Range requests for seeking."""
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreClientContentNegotiation
+
+    def get(self, request, user_id):
+        mentor = get_object_or_404(User, id=user_id, role='mentor')
+        if not mentor.mentor_intro_video:
+            raise Http404("Mentor has no intro video.")
+        return ranged_file_response(request, mentor.mentor_intro_video.path)
+
+
 class SendOTPView(generics.GenericAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = [IPTokenBucketThrottle, EmailTokenBucketThrottle]
+    throttle_scope = 'otp'
 
     def post(self, request):
         email = request.data.get('email')
@@ -264,28 +314,21 @@ class SendOTPView(generics.GenericAPIView):
         if not email:
             return Response({'error': 'Email is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            user = User.objects.get(email=email)
-            if purpose == 'registration' and user.is_active:
-                return Response({'error': 'User already verified. Please log in.'}, status=status.HTTP_400_BAD_REQUEST)
-        except User.DoesNotExist:
-            if purpose == 'password_reset':
-                return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
-            # Create inactive user for registration
-            user = User.objects.create(email=email, is_active=False)
-
-        otp = str(random.randint(100000, 999999))
-        user.email_otp = otp
-        user.otp_created_at = timezone.now()
-        user.save()
-
-        # You can customize this with templates or an email service
-        send_mail(
+        # The code lives in the OTP store, no user row is created or written
+        is_active = User.objects.filter(email=email).values_list('is_active', flat=True).first()
+        if purpose == 'registration' and is_active:
+            return Response({'error': 'User already verified. Please log in.'}, status=status.HTTP_400_BAD_REQUEST)
+        if purpose == 'password_reset' and is_active is None:
+            return Response({'error': 'User not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        otp = issue_otp(email, purpose)
+
+        # Delivered by the send_outbox dispatcher
+        queue_mail(
             subject='Your OTP Code',
             message=f'Your OTP is: {otp}',
             from_email=None,
             recipient_list=[email],
-             fail_silently=False,
         )
 
         return Response({'message': f'OTP sent to {email}.'}, status=status.HTTP_200_OK)
@@ -304,25 +347,30 @@ def send_message_view(request):
 
     if not chat_id or not text:
         return Response({'error': 'chat_id and text are required'}, status=400)
+    if '/' in chat_id:
+        return Response({'error': 'Invalid chat_id'}, status=400)
 
     sender = request.user
+    participants = chat_participants(chat_id)
+    if participants is not None and sender.id not in participants:
+        return Response({'error': 'Not a participant of this chat'}, status=403)
 
     message = {
         'text': text.strip(),
         'senderId': sender.id,
         'senderName': sender.first_name + sender.last_name,
-        'timestamp': datetime.utcnow(),
+        'timestamp': timezone.now(),
     }
 
+    # Committed to Firestore in the background, together with other recent messages
     try:
-        db.collection('chats').document(chat_id).collection('messages').add(message)
-        return Response({'status': 'Message sent'})
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+        message_id = writer.submit(f'chats/{chat_id}/messages', message)
+    except WriterOverloaded:
+        return Response({'error': 'Chat is busy, try again shortly'}, status=503)
+    return Response({'status': 'Message sent', 'message_id': message_id})
 
 
 # views.py
-from firebase_admin import auth as firebase_auth
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -331,7 +379,7 @@ from rest_framework.response import Response
 @permission_classes([IsAuthenticated])
 def get_firebase_token(request):
     user = request.user
-    uid = f"user_{user.id}"  # Firebase UID must be unique and string
+    uid = firebase_uid(user)
 
     # Optional custom claims (e.g., user role)
     additional_claims = {
@@ -341,8 +389,8 @@ def get_firebase_token(request):
         "last_name":user.last_name
     }
 
-    # Generate Firebase custom token
-    firebase_token = firebase_auth.create_custom_token(uid, additional_claims)
+    # Signing is expensive, a token is reused until shortly before it expires
+    firebase_token = cached_custom_token(uid, additional_claims)
 
     return Response({"firebase_token": firebase_token.decode('utf-8')})
 